@@ -17,17 +17,32 @@
 # Author: Satheesh Rajendran<sathnaga@linux.vnet.ibm.com>
 
 import os
+import glob
 import shutil
 import time
 import json
 import sys
+import re
 import shlex
+import signal
+import tarfile
+import fnmatch
+import sqlite3
+import subprocess
 import argparse
+import atexit
 import configparser
+import tempfile
 import binascii
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from lib.logger import logger_init
 from lib import helper
+from lib.imagestore import ImageStore, create_overlay
+from lib.progress import ProgressTracker
+from lib.results_db import ResultsDB
+from lib.sampler import ResourceSampler
 
 AVOCADO_CONFIG_DIR = "%s/.config/avocado" % os.environ['HOME']
 BASE_PATH = os.path.dirname(os.path.abspath(__file__))
@@ -59,10 +74,98 @@ class Testsuite_status(Enum):
     Run = "Run"
     Not_Run = "Not_Run"
     Cant_Run = "Cant_Run"
+    Interrupt = "Interrupt"
 
 
 count_result = {_.value: 0 for _ in Result}
 count_testsuites_status = {_.value: 0 for _ in Testsuite_status}
+# Serializes updates of the above tallies when suites run concurrently
+count_lock = threading.Lock()
+BOOTSTRAP_MANIFEST = "bootstrap_manifest.json"
+# How a testsuite was run, saved in its job dir
+SUITE_INFO_FILE = "wrapper-suite.json"
+# Final status of every testsuite of a run, saved in its results dir
+RUN_SUMMARY_FILE = "wrapper-summary.json"
+# Options of this run passed on to the fleet hosts, as
+# (args attribute, option, whether it takes a value)
+FLEET_BOOTSTRAP_OPTIONS = (('enable_kvm', '--enable-kvm', False),
+                           ('guest_os', '--guest-os', True),
+                           ('vt_type', '--vt', True),
+                           ('no_guest_download', '--no-download', False),
+                           ('no_deps_check', '--no-deps-check', False),
+                           ('install_deps', '--install-deps', False),
+                           ('git_mirror', '--git-mirror', False),
+                           ('sparse_checkout', '--sparse-checkout', False))
+FLEET_RUN_OPTIONS = FLEET_BOOTSTRAP_OPTIONS + (('testdir', '--use-test-dir', False),
+                                               ('verbose', '--verbose', False),
+                                               ('guest_overlay', '--guest-overlay', False),
+                                               ('runner', '--runner', False),
+                                               ('changed_only', '--changed-only', False),
+                                               ('always_run', '--always-run', True),
+                                               ('interval', '--interval-time', True),
+                                               ('only_filter', '--only-filter', True),
+                                               ('no_filter', '--no-filter', True),
+                                               ('add_args', '--additional-args', True),
+                                               ('parallel_suites', '--parallel-suites', True),
+                                               ('suite_timeout', '--suite-timeout', True),
+                                               ('test_timeout', '--test-timeout', True),
+                                               ('sample_interval', '--sample-interval', True))
+# Tags of the leading comment lines of test config files
+CFG_TAG = re.compile(r'^#\s*(pci_root|timeout|test_timeout):\s*(\S+)')
+# --suite-timeout and --test-timeout auto allow this many times the usual
+# duration of a suite or test, and at least AUTO_TIMEOUT_MIN seconds
+AUTO_TIMEOUT_FACTOR = 3
+AUTO_TIMEOUT_MIN = 600
+# Signals sent to the process group of a timed out job, with the seconds
+# given to exit after each
+STOP_SIGNALS = ((signal.SIGINT, 60), (signal.SIGTERM, 15), (signal.SIGKILL, 0))
+# Deadline of each test suite, by --run-suite entry, None for no limit
+suite_deadlines = {}
+suite_deadlines_lock = threading.Lock()
+# Set on Ctrl-C, the test suites not started yet are skipped
+run_interrupted = threading.Event()
+# Popen of each running avocado job -> its Testsuite object
+live_jobs = {}
+live_jobs_lock = threading.Lock()
+# Test statuses --rerun-failed runs again
+RERUN_STATUSES = ('FAIL', 'ERROR', 'INTERRUPTED')
+# Input file section of each line of the rerun_failed cfg, the one of the
+# suite the failed test came from
+rerun_sections = {}
+# Test repo commits and cfg entries of the host suites at their last fully
+# passing run, for --changed-only
+LAST_PASS_FILE = "last_pass.json"
+# cfg entries of the host suites parsed in this run, by suite name
+suite_cfg_entries = {}
+changed_files_cache = {}
+unchanged_suites = set()
+image_store = None
+image_store_lock = threading.Lock()
+# vt-bootstrap runs write the same avocado-vt data tree, one at a time
+vt_bootstrap_lock = threading.Lock()
+# input file sections, and the mux files edited with them
+input_sections = None
+edited_mux_files = {}
+# Edited mux files used within this many seconds are never evicted
+MUX_CACHE_MIN_AGE = 24 * 60 * 60
+# Scratch dir of this invocation, so that concurrent runs do not share
+# generated files
+RUN_DIR = None
+run_config = None
+# Id of this invocation, recorded with its jobs, ordered by start time
+RUN_ID = None
+# Compiled no run filters, by norun sections of the environment
+norun_filters = {}
+progress = None
+# Results store of all the runs, and the id of this run in it
+results_db = None
+results_run_id = None
+sampler = None
+# Seconds of resource samples kept in memory
+SAMPLER_WINDOW = 6 * 60 * 60
+# git ls-remote results, valid for the life of the run
+ls_remote_cache = {}
+ls_remote_lock = threading.Lock()
 
 
 class TestSuite():
@@ -73,7 +176,7 @@ class TestSuite():
     host_add_args = ""
 
     def __init__(self, name, resultdir, vt_type, test=None, mux=None, args=None,
-                 use_test_dir=False):
+                 use_test_dir=False, tempmux='', resource=None):
         self.jobid = binascii.b2a_hex(os.urandom(20)).decode()
         self.name = str(name)
         self.shortname = "_".join(self.name.split('_')[1:])
@@ -83,8 +186,27 @@ class TestSuite():
         self.conf = None
         self.test = test
         self.mux = mux
+        # Test suite of the --run-suite option this testsuite comes from,
+        # ex: host_io_disk_fvt for each test of its cfg
+        self.suite = self.name
+        # mux file as given in the test config, before input file edits
+        self.tempmux = tempmux or ''
+        # input file section the mux file is edited with
+        self.section = None
+        # Device the tests use, ex: the pci_root of an adapter, testsuites
+        # of the same resource are never run at the same time
+        self.resource = resource
+        # Seconds the whole suite and each of its tests may run, set with
+        # "# timeout:" and "# test_timeout:" cfg tags
+        self.suite_timeout = None
+        self.test_timeout = None
+        self.timed_out = False
+        # stopped with Ctrl-C
+        self.interrupted = False
+        self.started = None
         self.args = args
         self.run = Testsuite_status.Not_Run.value
+        self.result_state = None
         self.runsummary = None
         self.runlink = None
         if use_test_dir:
@@ -95,6 +217,31 @@ class TestSuite():
             self.vt_type = None
 
     def jobdir(self):
+        """
+        Find the job dir of this testsuite, which is kept once found
+        """
+        if self.job_dir and os.path.isdir(self.job_dir):
+            return self.job_dir
+        job_dir = self.find_jobdir()
+        self.job_dir = job_dir or None
+        return job_dir
+
+    def find_jobdir(self):
+        """
+        Scan the results dir for the job dir of this testsuite
+        """
+        # avocado points 'latest' to the job that finished last and
+        # names the job dir after the short job id
+        candidates = [os.path.join(self.resultdir, 'latest')]
+        candidates.extend(glob.glob(os.path.join(self.resultdir,
+                                                 'job-*-%s' % self.jobid[:7])))
+        for candidate in candidates:
+            id_file = os.path.join(candidate, 'id')
+            if not os.path.isfile(id_file):
+                continue
+            with open(id_file) as filep:
+                if filep.read().strip() == self.jobid:
+                    return os.path.realpath(candidate)
         cmd = 'grep %s %s/*/id|grep job-' % (self.jobid, self.resultdir)
         status, self.job_dir = helper.runcmd(cmd, ignore_status=True)
         if status != 0:
@@ -137,13 +284,22 @@ def env_check(enable_kvm):
     logger.info("Check for environment")
     not_found = []
     (env_ver, env_type, cmd_pat) = helper.get_env_type(enable_kvm)
+    dist = helper.get_dist()[0]
+    inventory = helper.PackageInventory(dist)
+    if not inventory.loaded:
+        logger.debug("Unable to list installed packages, querying them one by one")
+
+    def is_installed(package, query, substring=False):
+        if inventory.loaded:
+            return inventory.has(package, substring)
+        return helper.runcmd(cmd_pat % query, ignore_status=True)[0] == 0
+
     # try to check base packages using major version numbers
     env_ver = env_ver.split('.')[0]
     env_deps = []
     if not CONFIGFILE.has_section('deps_%s' % env_ver):
         # Fallback to base name if specific version is not found
-        dist = helper.get_dist()
-        env_ver = dist[0]
+        env_ver = dist
 
     if CONFIGFILE.has_section('deps_%s' % env_ver):
         packages = CONFIGFILE.get('deps_%s' % env_ver, 'packages')
@@ -154,14 +310,16 @@ def env_check(enable_kvm):
             # Substrings
             formatted_dep = dep[:-1]
             original_dep = formatted_dep
+            substring = True
         else:
             #Absoulute strings
-            if helper.get_dist()[0] == "ubuntu":
+            if dist == "ubuntu":
                 formatted_dep = f"^{dep}/"
             else:
                 formatted_dep = dep
             original_dep = dep
-        if helper.runcmd(cmd_pat % formatted_dep, ignore_status=True)[0] != 0:
+            substring = False
+        if not is_installed(original_dep, formatted_dep, substring):
             not_found.append(original_dep)
 
     env_deps = []
@@ -172,7 +330,7 @@ def env_check(enable_kvm):
         if packages != '':
             env_deps = packages.split(',')
     for dep in env_deps:
-        if helper.runcmd(cmd_pat % dep, ignore_status=True)[0] != 0:
+        if not is_installed(dep, dep, substring=True):
             not_found.append(dep)
     if not_found:
         if args.install_deps:
@@ -198,13 +356,88 @@ def is_avocado_plugin_avl(plugin):
     return True
 
 
-def need_bootstrap(enable_kvm=False):
+def get_local_files(path, suffix=''):
+    """
+    Return the files directly under the given dir, matching the suffix
+    """
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, fle) for fle in os.listdir(path)
+                  if fle.endswith(suffix) and os.path.isfile(os.path.join(path, fle)))
+
+
+def bootstrap_inputs(enable_kvm=False, guest_os=None):
+    """
+    Fingerprint the inputs of each bootstrap stage
+    :return: dict of stage name and its fingerprint
+    """
+    isos = [(os.path.basename(fle), os.path.getsize(fle), os.path.getmtime(fle))
+            for fle in get_local_files("%s/isos" % BASE_PATH, ".iso")]
+    scripts = [(fle, helper.file_digest(fle), dest)
+               for src, dest in [(prescript, prescript_dir), (postscript, postscript_dir)]
+               for fle in get_local_files(src)]
+    # the output dir is left out, each run writes its own avocado config
+    inputs = {'config': helper.digest([BASE_PATH, TEST_DIR, DATA_DIR]),
+              'pip': helper.digest([pipManager.installitems, enable_kvm]),
+              'scripts': helper.digest(scripts)}
+    if enable_kvm:
+        inputs['isos'] = helper.digest([DATA_DIR, isos])
+        inputs['kvm'] = helper.digest([DATA_DIR, inputs['pip'], guest_os])
+    return inputs
+
+
+def get_repo_state(repo, basepath):
+    """
+    Return the remote and the local commit of the given test repo
+    :param repo: tuple of repo link and branch(optional)
+    :param basepath: base path where the repository is downloaded
+    """
+    if not isinstance(repo, tuple):
+        repo = (repo, '')
+    cmd = "git ls-remote %s %s" % (repo[0], repo[1] or 'HEAD')
+    status, output = git_ls_remote(cmd, ignore_status=True)
+    remote_sha = output.split()[0] if status == 0 and output.strip() else None
+    repo_name = repo[0].split('/')[-1].split('.git')[0]
+    return (remote_sha, helper.get_git_head(os.path.join(basepath, repo_name)))
+
+
+def load_bootstrap_manifest():
+    """
+    Load the record of what the last bootstrap did, with stage input
+    fingerprints, installed package versions and test repo commits
+    """
+    manifest = helper.load_json(os.path.join(CACHE_DIR, BOOTSTRAP_MANIFEST), {})
+    for key in ['stages', 'versions', 'repos']:
+        manifest.setdefault(key, {})
+    return manifest
+
+
+def save_bootstrap_manifest(manifest):
+    """
+    Store the bootstrap manifest
+    """
+    try:
+        helper.save_json(os.path.join(CACHE_DIR, BOOTSTRAP_MANIFEST), manifest)
+    except OSError as error:
+        logger.warning("Unable to save bootstrap manifest: %s", error)
+
+
+def need_bootstrap(enable_kvm=False, guest_os=None):
     """
     Check if bootstrap required
     :return: True if bootstrap is needed
     """
     logger.debug("Check if bootstrap required")
     needs_bootstrap = False
+    # Only report the stages whose inputs changed since last bootstrap, a
+    # test run does not upgrade packages or move the test repos on its own
+    manifest = load_bootstrap_manifest()
+    if manifest['stages']:
+        changed = [stage for stage, fingerprint in bootstrap_inputs(enable_kvm, guest_os).items()
+                   if manifest['stages'].get(stage) != fingerprint]
+        if changed:
+            logger.info("Bootstrap stages %s changed since last bootstrap, run with "
+                        "--bootstrap --incremental-bootstrap to redo them", ', '.join(changed))
     # Check for avocado
     if 'no avocado ' in helper.get_avocado_bin(ignore_status=True):
         logger.debug("Avocado needs to be installed")
@@ -224,17 +457,105 @@ def need_bootstrap(enable_kvm=False):
     return needs_bootstrap
 
 
-def get_repo(repo, basepath):
+def git_ls_remote(cmd, **kwargs):
+    """
+    Run the given git ls-remote query, only once per run
+    :param kwargs: Keyword arguments of helper.runcmd
+    :return: Status and output of the command
+    """
+    with ls_remote_lock:
+        if cmd in ls_remote_cache:
+            return ls_remote_cache[cmd]
+    result = helper.runcmd(cmd, **kwargs)
+    if result[0] == 0:
+        with ls_remote_lock:
+            ls_remote_cache[cmd] = result
+    return result
+
+
+def update_mirror(repo_url, mirror_dir):
+    """
+    Create or refresh the local bare mirror of the given repo
+    :return: path of the mirror
+    """
+    repo_name = repo_url.split('/')[-1].split('.git')[0]
+    mirror_path = os.path.join(mirror_dir, "%s.git" % repo_name)
+    if os.path.isdir(mirror_path):
+        cmd = "git -C %s remote update --prune" % mirror_path
+    else:
+        os.makedirs(mirror_dir, exist_ok=True)
+        cmd = "git clone --mirror %s %s" % (repo_url, mirror_path)
+    helper.runcmd(cmd, err_str="Failed to update mirror of %s repository:" % repo_name,
+                  debug_str="Updating local mirror %s" % mirror_path)
+    return mirror_path
+
+
+def get_suite_test_paths(test_suites):
+    """
+    Collect the test repo dirs referenced by tests and yamls of the given
+    host test suites
+    :param test_suites: list of test suite names
+    :return: dict of repo name and set of dirs within that repo
+    """
+    paths = {}
+    for test_suite in test_suites:
+        if not test_suite.startswith('host_'):
+            continue
+        test_config_file = get_test_config_file('host', test_suite[len('host_'):])
+        if not os.path.isfile(test_config_file):
+            continue
+        with open(test_config_file, 'r') as filep:
+            for line in filep.read().splitlines():
+                if line.startswith("#") or not line.strip():
+                    continue
+                try:
+                    line = shlex.split(line)
+                except ValueError:
+                    continue
+                references = [line[0].strip('$').split(':')[0]]
+                if len(line) > 1 and '.yaml' in line[1]:
+                    references.append(line[1])
+                for reference in references:
+                    parts = os.path.normpath(reference).split(os.sep)
+                    if len(parts) > 2:
+                        paths.setdefault(parts[0], set()).add("/".join(parts[1:-1]))
+    return paths
+
+
+def widen_sparse_checkout(repo_path, dirs):
+    """
+    Add the given dirs to a sparse checkout of the test repo, if they are
+    not already checked out. Full checkouts are left alone.
+    :param repo_path: Path of the test repo
+    :param dirs: dirs needed within the repo
+    """
+    cmd = "git -C %s config --bool core.sparseCheckout" % repo_path
+    status, output = helper.runcmd(cmd, ignore_status=True)
+    if status != 0 or output.strip() != 'true':
+        return
+    missing = sorted(_ for _ in dirs if not os.path.isdir(os.path.join(repo_path, _)))
+    if not missing:
+        return
+    cmd = "git -C %s sparse-checkout add %s" % (repo_path,
+                                                " ".join(shlex.quote(_) for _ in missing))
+    helper.runcmd(cmd, err_str="Failed to extend sparse checkout of %s:" % repo_path,
+                  debug_str="Adding %s to sparse checkout of %s" % (missing, repo_path))
+
+
+def get_repo(repo, basepath, mirror_dir=None, sparse_paths=None):
     """
     To get given repo cloned/updated and install
     :param repo: tuple of repo link and branch(optional)
     :param basepath: base path where the repository has to be downloaded
+    :param mirror_dir: dir of local bare mirrors new clones borrow objects from
+    :param sparse_paths: dirs to check out when the repo has to be cloned,
+                         a partial clone with sparse checkout is done if given
     """
     if not isinstance(repo, tuple):
         repo = (repo, '')
 
     cmd_default_branch = "git ls-remote --symref %s HEAD | grep '^ref:' | awk '{print $2}' | cut -d'/' -f3" % repo[0]
-    status, default_branch = helper.runcmd(cmd_default_branch, err_str="Failed to find default branch for %s repository:" % repo[0])
+    status, default_branch = git_ls_remote(cmd_default_branch, err_str="Failed to find default branch for %s repository:" % repo[0])
     if status != 0:
         logger.warning(f"Failed to find default branch for {repo[0]} repository, going ahead assuming master branch as default branch")
         default_branch = "master"
@@ -243,7 +564,7 @@ def get_repo(repo, basepath):
     else:
         branch = repo[1]
     cmd_istag = "git ls-remote --refs %s %s" % (repo[0], branch)
-    status, res = helper.runcmd(cmd_istag, err_str="Failed to query refs for %s repository:" % branch)
+    status, res = git_ls_remote(cmd_istag, err_str="Failed to query refs for %s repository:" % branch)
     if "refs" not in res:
         logger.error(f"Invalid branch or tag '{repo[1]}' for repository '{repo[0]}'")
         sys.exit(1)
@@ -254,7 +575,12 @@ def get_repo(repo, basepath):
 
     repo_name = repo[0].split('/')[-1].split('.git')[0]
     repo_path = os.path.join(basepath, repo_name)
-    cmd_clone = "git clone %s %s" % (repo[0], repo_path)
+    cmd_clone = "git clone"
+    if sparse_paths is not None:
+        cmd_clone += " --filter=blob:none --sparse"
+    if mirror_dir:
+        cmd_clone += " --reference-if-able %s" % update_mirror(repo[0], mirror_dir)
+    cmd_clone += " %s %s" % (repo[0], repo_path)
 
     logger.info("\t3. Cloning/Updating the repo: %s with branch %s under %s" % (
                       repo_name, branch, repo_path))
@@ -268,17 +594,20 @@ def get_repo(repo, basepath):
 
     cmd = "cd %s && %s" % (repo_path, cmd_update)
     helper.runcmd(cmd, err_str="Failed to update %s repository:" % repo_name)
+    if sparse_paths:
+        widen_sparse_checkout(repo_path, sparse_paths)
 
 
-def create_config(logdir):
+def create_config(logdir, config_dir=AVOCADO_CONFIG_DIR):
     """
     Create the local avocado config file
     :param logdir: Log directory
+    :param config_dir: Directory to create avocado.conf in
+    :return: path of the config file
     """
-    logger.info("\t1. Creating Avocado Config")
     config = configparser.ConfigParser()
-    os.makedirs(AVOCADO_CONFIG_DIR, exist_ok=True)
-    avocado_conf = os.path.join(AVOCADO_CONFIG_DIR, "avocado.conf")
+    os.makedirs(config_dir, exist_ok=True)
+    avocado_conf = os.path.join(config_dir, "avocado.conf")
     config.add_section('datadir.paths')
     config.set('datadir.paths', 'base_dir', BASE_PATH)
     config.set('datadir.paths', 'test_dir', TEST_DIR)
@@ -303,84 +632,225 @@ def create_config(logdir):
     config.set('sysinfo.collectibles', 'profilers',
                os.path.join(BASE_PATH, "config/sysinfo/profilers"))
 
-    with open(avocado_conf, 'w+') as conf:
+    # another run may be reading it
+    tmp_conf = "%s.%s.tmp" % (avocado_conf, os.getpid())
+    with open(tmp_conf, 'w+') as conf:
         config.write(conf)
+    os.replace(tmp_conf, avocado_conf)
+    return avocado_conf
+
+
+def get_image_store():
+    """
+    Return the local image store, shared by the whole run
+    """
+    global image_store
+    with image_store_lock:
+        if image_store is None:
+            image_store = ImageStore(os.path.join(CACHE_DIR, 'images'))
+    return image_store
 
 
 def guest_download(guestos):
     """
-    Guest image downloading
+    Guest image downloading, a guest image downloaded before is put back
+    from the image store instead
     """
+    store = get_image_store()
+    images_dir = "%s/avocado-vt/images" % DATA_DIR
+    image_set = "guest:%s" % guestos
+    if store.get_set(image_set):
+        logger.info("Using the stored guest OS(%s) image", guestos)
+        store.link_set(image_set, images_dir)
+        store.save()
+        return
+    start_time = time.time()
     avocado_bin = helper.get_avocado_bin()
     cmd = '%s vt-bootstrap --vt-guest-os %s --yes-to-all' % (avocado_bin,
                                                              guestos)
-    helper.runcmd(cmd, err_str="Failed to Download Guest OS. Error:",
-                  info_str="Downloading the guest OS(%s) image" % guestos)
-
-
-def kvm_bootstrap(guest_os):
+    with vt_bootstrap_lock:
+        helper.runcmd(cmd, err_str="Failed to Download Guest OS. Error:",
+                      info_str="Downloading the guest OS(%s) image" % guestos)
+    # Store what the download brought in, the image being modified by
+    # tests, the store keeps its own copy of it
+    images = [fle for fle in get_local_files(images_dir)
+              if os.path.getmtime(fle) >= start_time]
+    if images:
+        store.add_set(image_set, images, hardlink=False)
+        store.save()
+
+
+def get_guest_image(guestos):
     """
-    Prepare KVM Test environment
+    Return the path of the qcow2 image of the given guest OS, if known
+    """
+    images_dir = "%s/avocado-vt/images" % DATA_DIR
+    stored = get_image_store().get_set("guest:%s" % guestos) or {}
+    images = [os.path.join(images_dir, fle) for fle in stored if fle.endswith('.qcow2')]
+    if not images:
+        # JeOS.27.ppc64le -> jeos-27-ppc64le.qcow2
+        name = guestos.lower().replace('.', '-')
+        images = [fle for fle in get_local_files(images_dir, '.qcow2')
+                  if os.path.basename(fle).startswith(name)]
+    images = [fle for fle in images if os.path.isfile(fle)]
+    return images[0] if images else None
+
+
+def vt_bootstrap(vt_type):
+    """
+    Prepare KVM Test environment of the given VT type
+    :param vt_type: qemu or libvirt
     """
     avocado_bin = helper.get_avocado_bin()
-    libvirt_cmd = '%s vt-bootstrap --vt-type libvirt \
-                  --vt-update-providers --vt-skip-verify-download-assets \
-                  --yes-to-all' % avocado_bin
-    helper.runcmd(libvirt_cmd, err_str="Failed to bootstrap vt libvirt. Error:",
-                  info_str="\t\ti) Bootstrapping VT libvirt")
-    qemu_cmd = '%s vt-bootstrap --vt-type qemu --vt-update-providers \
-               --vt-skip-verify-download-assets --yes-to-all' % avocado_bin
-    helper.runcmd(qemu_cmd, err_str="Failed to bootstrap vt qemu. Error:",
-                  info_str="\t\tii) Bootstrapping VT qemu")
-    if guest_os:
-        guestos_cmd = '%s vt-bootstrap --vt-guest-os %s --yes-to-all' % (avocado_bin,
-                                                                         guest_os)
-        helper.runcmd(guestos_cmd, err_str="Failed to Download Guest OS. Error:",
-                      info_str="\t\tiii) Downloading guest OS(%s) image" % guest_os)
-
-
-def bootstrap(enable_kvm=False, guest_os=None):
+    cmd = '%s vt-bootstrap --vt-type %s --vt-update-providers \
+           --vt-skip-verify-download-assets --yes-to-all' % (avocado_bin, vt_type)
+    with vt_bootstrap_lock:
+        helper.runcmd(cmd, err_str="Failed to bootstrap vt %s. Error:" % vt_type,
+                      info_str="\t\tBootstrapping VT %s" % vt_type)
+
+
+def bootstrap(enable_kvm=False, guest_os=None, incremental=False):
     """
     Prepare the environment for execution
 
+    Bootstrap stages run as a pipeline, each stage starts as soon as the
+    stages it depends on are done, so independent stages like repo sync
+    and pip install overlap.
+
     :params enable_kvm: Flag to enable kvm environment bootstrap
+    :params guest_os: Guest OS image to download
+    :params incremental: Redo only the stages whose inputs changed since
+                         the last bootstrap, instead of a clean bootstrap
     """
-    env_clean()
-    logger.info("Bootstrapping Framework")
-    create_config(outputdir)
-    if enable_kvm:
-        install_str = "\t2. Installing Avocado and Avocado-VT(KVM) Framework"
+    inputs = bootstrap_inputs(enable_kvm, guest_os)
+    if incremental:
+        manifest = load_bootstrap_manifest()
     else:
-        install_str = "\t2. Installing Avocado Framework"
-    logger.info(install_str)
-    pipManager.install()
-    if enable_kvm:
-        logger.info("\t2a.Bootstrapping Avocado-VT(KVM) Framework")
+        env_clean()
+        manifest = {'stages': {}, 'versions': {}, 'repos': {}}
+    manifest_lock = threading.Lock()
+
+    def is_done(stage, check=True):
+        with manifest_lock:
+            if manifest['stages'].get(stage) == inputs[stage] and check:
+                logger.info("\t   Skipping %s, unchanged since last bootstrap", stage)
+                return True
+            manifest['stages'].pop(stage, None)
+            return False
+
+    def mark_done(stage):
+        with manifest_lock:
+            manifest['stages'][stage] = inputs[stage]
+            save_bootstrap_manifest(manifest)
+
+    def config_stage():
+        if not is_done('config', os.path.isfile(os.path.join(AVOCADO_CONFIG_DIR, "avocado.conf"))):
+            logger.info("\t1. Creating Avocado Config")
+            create_config(outputdir)
+            mark_done('config')
+
+    def pip_stage():
+        if enable_kvm:
+            install_str = "\t2. Installing Avocado and Avocado-VT(KVM) Framework"
+        else:
+            install_str = "\t2. Installing Avocado Framework"
+        logger.info(install_str)
+        if not is_done('pip', manifest['versions'] == pipManager.installed_versions()):
+            pipManager.install()
+            versions = pipManager.installed_versions()
+            with manifest_lock:
+                manifest['versions'] = versions
+            mark_done('pip')
+
+    def isos_stage():
         # Copy if any isos present in the local folder
         dst_iso_path = "%s/avocado-vt/isos/linux/" % DATA_DIR
-        os.makedirs(dst_iso_path, exist_ok=True)
-        for fle in os.listdir("%s/isos" % BASE_PATH):
-            if fle.endswith(".iso"):
-                file_path = os.path.join(BASE_PATH, 'isos', fle)
-                dst_file = os.path.join(dst_iso_path, fle)
-                shutil.copyfile(file_path, dst_file)
-        kvm_bootstrap(guest_os)
-    helper.runcmd('mkdir -p %s' % TEST_DIR,
-                  debug_str="Creating test repo dir %s" % TEST_DIR,
-                  err_str="Failed to create test repo dir. Error: ")
-    for repo in TEST_REPOS:
-        get_repo(repo, TEST_DIR)
+        iso_files = get_local_files("%s/isos" % BASE_PATH, ".iso")
+        if not is_done('isos', all(os.path.isfile(os.path.join(dst_iso_path, os.path.basename(_)))
+                                   for _ in iso_files)):
+            os.makedirs(dst_iso_path, exist_ok=True)
+            # ISOs are only read, so they are hardlinked from the store
+            store = get_image_store()
+            for file_path in iso_files:
+                dst_file = os.path.join(dst_iso_path, os.path.basename(file_path))
+                store.link(store.add(file_path), dst_file)
+            store.save()
+            mark_done('isos')
+
+    mirror_dir = os.path.join(CACHE_DIR, 'git-mirrors') if args.git_mirror else None
+    sparse_paths = None
+    if args.sparse_checkout:
+        sparse_paths = get_suite_test_paths((args.run_suite or '').split(','))
+
+    def sync_repo(repo):
+        repo_key = helper.digest(repo)
+        if incremental:
+            state = get_repo_state(repo, TEST_DIR)
+            if state[0] and manifest['repos'].get(repo_key) == list(state):
+                logger.info("\t3. Skipping repo %s, unchanged since last bootstrap",
+                            repo[0] if isinstance(repo, tuple) else repo)
+                return
+        if sparse_paths is None:
+            get_repo(repo, TEST_DIR, mirror_dir)
+        else:
+            repo_name = (repo[0] if isinstance(repo, tuple) else repo).split('/')[-1].split('.git')[0]
+            get_repo(repo, TEST_DIR, mirror_dir, sparse_paths.get(repo_name, set()))
+        state = get_repo_state(repo, TEST_DIR)
+        with manifest_lock:
+            manifest['repos'][repo_key] = list(state)
+            save_bootstrap_manifest(manifest)
+
+    def repos_stage():
+        helper.runcmd('mkdir -p %s' % TEST_DIR,
+                      debug_str="Creating test repo dir %s" % TEST_DIR,
+                      err_str="Failed to create test repo dir. Error: ")
+        # Repos are independent, sync them all at once
+        with ThreadPoolExecutor(max_workers=max(len(TEST_REPOS), 1)) as pool:
+            for job in [pool.submit(sync_repo, repo) for repo in TEST_REPOS]:
+                job.result()
+
+    def scripts_stage():
+        scripts_present = all(os.path.isfile(os.path.join(dest, fle))
+                              for src, dest in [(prescript, prescript_dir), (postscript, postscript_dir)]
+                              if os.path.isdir(src) for fle in os.listdir(src))
+        if not is_done('scripts', scripts_present):
+            if os.path.isdir(prescript):
+                if len(os.listdir(prescript)):
+                    if not os.path.exists(prescript_dir):
+                        os.makedirs(prescript_dir)
+                    helper.copy_dir_file(prescript, prescript_dir)
+            if os.path.isdir(postscript):
+                if len(os.listdir(postscript)):
+                    if not os.path.exists(postscript_dir):
+                        os.makedirs(postscript_dir)
+                    helper.copy_dir_file(postscript, postscript_dir)
+            mark_done('scripts')
 
-    if os.path.isdir(prescript):
-        if len(os.listdir(prescript)):
-            if not os.path.exists(prescript_dir):
-                os.makedirs(prescript_dir)
-            helper.copy_dir_file(prescript, prescript_dir)
-    if os.path.isdir(postscript):
-        if len(os.listdir(postscript)):
-            if not os.path.exists(postscript_dir):
-                os.makedirs(postscript_dir)
-            helper.copy_dir_file(postscript, postscript_dir)
+    logger.info("Bootstrapping Framework")
+    # stage name: (function, stages it depends on)
+    stages = {'config': (config_stage, []),
+              'pip': (pip_stage, []),
+              'repos': (repos_stage, []),
+              'scripts': (scripts_stage, [])}
+    if enable_kvm:
+        stages['isos'] = (isos_stage, [])
+        if not is_done('kvm', os.path.isdir("%s/avocado-vt" % DATA_DIR)):
+            # VT bootstrap needs avocado-vt and the avocado config in place.
+            # The guest image download is a vt-bootstrap run too, which
+            # updates the providers and cfgs, so it waits for the first VT
+            # bootstrap, and takes turns with the second one unless the
+            # image comes from the image store
+            stages['vt-libvirt'] = (lambda: vt_bootstrap('libvirt'), ['config', 'pip'])
+            stages['vt-qemu'] = (lambda: vt_bootstrap('qemu'), ['vt-libvirt'])
+            kvm_deps = ['vt-qemu']
+            if guest_os:
+                stages['guest-image'] = (lambda: guest_download(guest_os), ['vt-libvirt'])
+                kvm_deps.append('guest-image')
+            stages['kvm'] = (lambda: mark_done('kvm'), kvm_deps)
+    timings = helper.run_stages(stages)
+    logger.info("Bootstrap stage timings:\n%s",
+                "\n".join("\t%s %.1fs" % (stage.ljust(15), timings[stage])
+                          for stage in stages))
 
 
 def run_test(testsuite, avocado_bin, runner, linux_src_path):
@@ -399,23 +869,35 @@ def run_test(testsuite, avocado_bin, runner, linux_src_path):
         runner = '--max-parallel-tasks=1'
 
     logger.info('')
+    overlay = None
     if 'guest' in testsuite.type:
         guest_args = TestSuite.guest_add_args
         logger.info("Running Guest Tests Suite %s", testsuite.shortname)
         if "sanity" in testsuite.shortname:
             guest_args = " --vt-only-filter %s " % args.guest_os
-        cmd = "%s run --vt-type %s --vt-config %s \
+        if args.guest_overlay and testsuite.vt_type == 'qemu' and testsuite.shortname != 'install':
+            base_image = get_guest_image(args.guest_os)
+            if base_image:
+                # Run on a copy-on-write overlay, leaving the image pristine
+                overlay = os.path.join(RUN_DIR, 'overlays', "%s.qcow2" % testsuite.name)
+                create_overlay(base_image, overlay)
+                guest_args += ' --vt-extra-params "image_name=%s"' % overlay[:-len('.qcow2')]
+            else:
+                logger.warning("Guest image of %s not found, running without overlay",
+                               args.guest_os)
+        cmd = "%s --config %s run --vt-type %s --vt-config %s \
                 --force-job-id %s \
-                --job-results-dir %s %s" % (avocado_bin, testsuite.vt_type,
+                --job-results-dir %s %s" % (avocado_bin, run_config, testsuite.vt_type,
                                             testsuite.config(),
                                             testsuite.jobid,
                                             testsuite.resultdir, guest_args)
     if 'host' in testsuite.type:
         logger.info("Running Host Tests Suite %s", testsuite.shortname)
         if nrun:
-            cmd = "%s run %s %s" % (avocado_bin, runner, os.path.join(TEST_DIR, testsuite.test))
+            cmd = "%s --config %s run %s %s" % (avocado_bin, run_config, runner,
+                                                os.path.join(TEST_DIR, testsuite.test))
         else:
-            cmd = "%s run %s %s" % (avocado_bin, runner, testsuite.test)
+            cmd = "%s --config %s run %s %s" % (avocado_bin, run_config, runner, testsuite.test)
         if testsuite.mux:
             cmd += " -m %s" % os.path.join(TEST_DIR, testsuite.mux)
         cmd += " --force-job-id %s \
@@ -434,8 +916,10 @@ def run_test(testsuite, avocado_bin, runner, linux_src_path):
                 exit("kernel-src path is not available, please check")
             helper.gcov_reset()
         logger.info("Running: %s", cmd)
-        status = os.system(cmd)
-        status = int(bin(int(status))[2:].zfill(16)[:-8], 2)
+        testsuite.started = time.time()
+        status = run_avocado(testsuite, cmd)
+        if overlay and os.path.exists(overlay):
+            os.remove(overlay)
         # Capturing the test and yaml names for gcov here
         if linux_src_path:
             test_name = testsuite.test + " " + testsuite.tempmux
@@ -453,35 +937,776 @@ def run_test(testsuite, avocado_bin, runner, linux_src_path):
                 helper.gcov_code_coverage(linux_src_path, test_name)
             helper.runcmd("cp %s/final_files.txt %s/" % (linux_src_path, outputdir),
                           ignore_status=True)
+        if testsuite.timed_out or testsuite.interrupted:
+            salvage_results(testsuite)
+            return
         if status >= 2:
             testsuite.runstatus(Testsuite_status.Not_Run.value, "Command execution failed")
-            count_testsuites_status[Testsuite_status.Not_Run.value] += 1
+            with count_lock:
+                count_testsuites_status[Testsuite_status.Not_Run.value] += 1
             return
     except Exception as error:
         logger.error("Running testsuite %s failed with error\n%s",
                      testsuite.name, error)
         testsuite.runstatus(Testsuite_status.Not_Run.value, "Command execution failed")
-        count_testsuites_status[Testsuite_status.Not_Run.value] += 1
+        with count_lock:
+            count_testsuites_status[Testsuite_status.Not_Run.value] += 1
         return
     logger.info('')
-    result_link = testsuite.jobdir()
-    if result_link:
-        result_json = result_link + "/results.json"
-        result_link += "/job.log\n"
-        with open(result_json, encoding="utf-8") as filep:
-            result_state = json.load(filep)
+    job_dir = testsuite.jobdir()
+    if job_dir:
+        save_suite_info(testsuite, job_dir)
+        save_resource_samples(testsuite, job_dir)
+        collect_results(testsuite, job_dir)
+    else:
+        testsuite.runstatus(Testsuite_status.Not_Run.value, "Unable to find job log file")
+        with count_lock:
+            count_testsuites_status[Testsuite_status.Not_Run.value] += 1
+    return
+
+
+def salvage_results(testsuite):
+    """
+    Mark a timed out or Ctrl-C stopped testsuite interrupted, counting the
+    results its job wrote before it was stopped
+    """
+    summary = "Timed out" if testsuite.timed_out else "Interrupted by user"
+    job_dir = testsuite.jobdir()
+    if job_dir:
+        save_suite_info(testsuite, job_dir)
+        save_resource_samples(testsuite, job_dir)
+    if job_dir and os.path.isfile(os.path.join(job_dir, "results.json")):
+        try:
+            collect_results(testsuite, job_dir, Testsuite_status.Interrupt.value, summary)
+            return
+        except ValueError as error:
+            logger.debug("Partial results of %s unreadable: %s", testsuite.name, error)
+    testsuite.runstatus(Testsuite_status.Interrupt.value, summary,
+                        job_dir + "/job.log" if job_dir else '')
+    with count_lock:
+        count_testsuites_status[Testsuite_status.Interrupt.value] += 1
+
+
+def collect_results(testsuite, job_dir, status=Testsuite_status.Run.value,
+                    summary="Successfully executed"):
+    """
+    Add the results of the job of the testsuite to the counts of the run
+    :param testsuite: Testsuite object, run
+    :param job_dir: Job results dir of the testsuite
+    :param status: Testsuite_status value of the testsuite
+    :param summary: Run summary of the testsuite
+    """
+    result_json = job_dir + "/results.json"
+    result_link = job_dir + "/job.log\n"
+    with open(result_json, encoding="utf-8") as filep:
+        result_state = json.load(filep)
+    store_results(testsuite, job_dir, result_state)
+    testsuite.result_state = result_state
+    with count_lock:
         for state in count_result:
             if state in result_state.keys():
                 count_result[Result.Testcount.value] += int(result_state[state])
                 count_result[state] += int(result_state[state])
                 result_link += "| %s %s |" % (state.upper(),
                                               str(result_state[state]))
-        testsuite.runstatus(Testsuite_status.Run.value, "Successfully executed", result_link)
-        count_testsuites_status[Testsuite_status.Run.value] += 1
+        count_testsuites_status[status] += 1
+    testsuite.runstatus(status, summary, result_link)
+
+
+def save_suite_info(testsuite, job_dir):
+    """
+    Record in the job dir how the testsuite was run, for --rerun-failed
+    """
+    try:
+        helper.save_json(os.path.join(job_dir, SUITE_INFO_FILE),
+                         {'name': testsuite.name, 'type': testsuite.type,
+                          'test': testsuite.test, 'mux': testsuite.tempmux,
+                          'args': testsuite.args, 'section': testsuite.section,
+                          'run_id': RUN_ID})
+    except OSError as error:
+        logger.debug("Unable to save suite info in %s: %s", job_dir, error)
+
+
+def find_result_files(results_path):
+    """
+    Return the sorted results.json files of the jobs under a results dir
+    """
+    result_files = []
+    for root, dirs, files in os.walk(results_path):
+        # skip the latest symlink, which points to a job already walked
+        dirs[:] = [_ for _ in dirs if not os.path.islink(os.path.join(root, _))]
+        if 'results.json' in files:
+            result_files.append(os.path.join(root, 'results.json'))
+            # nothing more to find within a job dir
+            dirs[:] = []
+    return sorted(result_files)
+
+
+def get_failed_tests(results_path):
+    """
+    Collect the failed tests of the jobs of a previous run
+
+    A results dir keeps the jobs of every run made with it, only the jobs
+    of the last run recorded in it are looked at.
+    :param results_path: Results dir of the run, a job dir, or a
+                         results.json file
+    :return: tuple of the test config lines of the failed host tests, the
+             input file section of each line, and the set of guest suites
+             with failures
+    """
+    if os.path.isfile(results_path):
+        result_files = [results_path]
     else:
-        testsuite.runstatus(Testsuite_status.Not_Run.value, "Unable to find job log file")
-        count_testsuites_status[Testsuite_status.Not_Run.value] += 1
-    return
+        result_files = find_result_files(results_path)
+    infos = {result_file: helper.load_json(os.path.join(os.path.dirname(result_file),
+                                                        SUITE_INFO_FILE), {})
+             for result_file in result_files}
+    run_ids = {info.get('run_id') for info in infos.values()} - {None}
+    if run_ids:
+        last_run = max(run_ids)
+        result_files = [_ for _ in result_files if infos[_].get('run_id') == last_run]
+        logger.info("Looking for failed tests in the %s jobs of run %s",
+                    len(result_files), last_run)
+    elif len(result_files) > 1:
+        logger.warning("No run recorded in %s, looking for failed tests in all its %s jobs",
+                       results_path, len(result_files))
+    cfg_lines = []
+    sections = {}
+    guest_suites = set()
+    for result_file in result_files:
+        results = helper.load_json(result_file, {})
+        failed = [_ for _ in results.get('tests', []) if _.get('status') in RERUN_STATUSES]
+        if not failed:
+            continue
+        info = infos[result_file]
+        if info.get('type') == 'guest':
+            guest_suites.add(info['name'])
+            continue
+        if not info:
+            logger.warning("%s was not run by this wrapper version, rerunning its "
+                           "failed tests without mux file and arguments", result_file)
+        for test in failed:
+            test_name = str(test.get('name') or test.get('id') or '')
+            # "1-/path/to/test.py:Class.test;run-variant" -> "/path/to/test.py:Class.test"
+            test_ref = re.sub(r'^\d+-', '', test_name).split(';')[0]
+            if test_ref.startswith(os.path.join(TEST_DIR, '')):
+                test_ref = test_ref[len(os.path.join(TEST_DIR, '')):]
+            line = [test_ref]
+            if info.get('mux'):
+                line.append(info['mux'])
+            if info.get('args'):
+                line.append(info['args'].strip())
+            cfg_line = ' '.join(shlex.quote(_) for _ in line)
+            if cfg_line not in cfg_lines:
+                cfg_lines.append(cfg_line)
+                sections[cfg_line] = info.get('section')
+            elif sections[cfg_line] != info.get('section'):
+                logger.warning("%s failed with input file sections %s and %s, "
+                               "rerunning it once with %s", cfg_line, sections[cfg_line],
+                               info.get('section'), sections[cfg_line])
+    return cfg_lines, sections, guest_suites
+
+
+def save_resource_samples(testsuite, job_dir):
+    """
+    Write the resource samples taken while the testsuite ran into its
+    job dir, as resources.csv
+    """
+    if sampler is None or testsuite.started is None:
+        return
+    try:
+        count = sampler.write_csv(os.path.join(job_dir, "resources.csv"), testsuite.started)
+        logger.debug("Saved %s resource samples of %s", count, testsuite.name)
+    except OSError as error:
+        logger.debug("Unable to save resource samples in %s: %s", job_dir, error)
+
+
+def store_results(testsuite, job_dir, result_state):
+    """
+    Ingest the results of the testsuite into the results store, failures
+    of the store do not fail the run
+    """
+    if results_db is None:
+        return
+    try:
+        results_db.add_suite(results_run_id, testsuite.name, job_dir, result_state)
+    except sqlite3.Error as error:
+        logger.warning("Unable to store results of %s in %s: %s",
+                       testsuite.name, results_db.path, error)
+
+
+def get_auto_timeout(names):
+    """
+    Return the auto timeout of the given testsuites run one after other,
+    None unless all of them have a duration in the results store
+    """
+    if results_db is None:
+        return None
+    try:
+        durations = results_db.suite_durations(names)
+    except sqlite3.Error as error:
+        logger.debug("Unable to read durations of %s: %s", names, error)
+        return None
+    if not names or not all(name in durations for name in names):
+        return None
+    return max(int(sum(durations[name] for name in names) * AUTO_TIMEOUT_FACTOR),
+               AUTO_TIMEOUT_MIN)
+
+
+def start_suite_deadline(testsuite, testsuites):
+    """
+    Start the clock of the test suite of the testsuite, on its first test
+
+    A "# timeout:" tag of the test config comes first, then
+    --suite-timeout, which is either seconds or "auto" for a multiple of
+    the average duration of the tests of the suite in the results store.
+    :param testsuites: Testsuite objects run, the suite's among them
+    :return: deadline of the suite, None for no limit
+    """
+    with suite_deadlines_lock:
+        if testsuite.suite in suite_deadlines:
+            return suite_deadlines[testsuite.suite]
+    budget = None
+    if testsuite.suite_timeout:
+        budget = int(testsuite.suite_timeout)
+    elif args.suite_timeout == 'auto':
+        budget = get_auto_timeout([_.name for _ in testsuites if _.suite == testsuite.suite])
+    elif args.suite_timeout:
+        budget = int(args.suite_timeout)
+    with suite_deadlines_lock:
+        return suite_deadlines.setdefault(testsuite.suite,
+                                          time.time() + budget if budget else None)
+
+
+def get_job_timeout(testsuite):
+    """
+    Return the seconds the job of the testsuite may run, None for no limit
+
+    That is the limit of a test, from a "# test_timeout:" tag of the test
+    config or --test-timeout, seconds or "auto" for a multiple of its
+    average duration in the results store, cut to what is left of the
+    time of its suite.
+    """
+    timeout = None
+    if testsuite.test_timeout:
+        timeout = int(testsuite.test_timeout)
+    elif args.test_timeout == 'auto':
+        timeout = get_auto_timeout([testsuite.name])
+    elif args.test_timeout:
+        timeout = int(args.test_timeout)
+    with suite_deadlines_lock:
+        deadline = suite_deadlines.get(testsuite.suite)
+    if deadline:
+        left = max(int(deadline - time.time()), 1)
+        timeout = min(timeout, left) if timeout else left
+    return timeout
+
+
+def stop_job(proc, testsuite, timeout):
+    """
+    Stop a timed out job: interrupt its process group so that avocado
+    writes the results of the tests run so far, then terminate and kill
+    whatever is left
+    """
+    logger.warning("%s timed out after %ss, stopping it", testsuite.name, timeout)
+    testsuite.timed_out = True
+    for sig, grace in STOP_SIGNALS:
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            proc.wait(grace)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def interrupt_jobs():
+    """
+    Pass Ctrl-C on to all the running jobs, which are not in the process
+    group of the terminal, and keep new suites from starting
+    """
+    with live_jobs_lock:
+        run_interrupted.set()
+        jobs = list(live_jobs.items())
+    for proc, testsuite in jobs:
+        logger.warning("Interrupting %s", testsuite.name)
+        testsuite.interrupted = True
+        try:
+            os.killpg(proc.pid, signal.SIGINT)
+        except ProcessLookupError:
+            pass
+
+
+def run_avocado(testsuite, cmd):
+    """
+    Run the avocado command of the testsuite, passing its output through
+    and feeding the test status lines to the progress tracker. A job
+    running beyond the timeout of the testsuite is stopped.
+    :return: exit status of the command
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    # before the job starts, nothing may fail between its start and the
+    # try below, which waits for it
+    timeout = get_job_timeout(testsuite)
+    # own process group, to stop the job along with all its processes
+    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, env=env,
+                            universal_newlines=True, errors='replace',
+                            start_new_session=True)
+    watchdog = None
+    try:
+        with live_jobs_lock:
+            live_jobs[proc] = testsuite
+            # started while the run was being interrupted
+            if run_interrupted.is_set():
+                testsuite.interrupted = True
+                os.killpg(proc.pid, signal.SIGINT)
+        if timeout:
+            watchdog = threading.Timer(timeout, stop_job, (proc, testsuite, timeout))
+            watchdog.daemon = True
+            watchdog.start()
+        while True:
+            try:
+                for line in proc.stdout:
+                    sys.stdout.write(line)
+                    sys.stdout.flush()
+                    progress.feed(testsuite.name, line)
+                break
+            except KeyboardInterrupt:
+                # let avocado write the results of the tests run so far
+                interrupt_jobs()
+    finally:
+        proc.stdout.close()
+        status = proc.wait()
+        with live_jobs_lock:
+            live_jobs.pop(proc, None)
+        if watchdog:
+            watchdog.cancel()
+        progress.end_job(testsuite.name)
+    if status < 0:
+        # killed by a signal, report it the way the shell does
+        status = 128 - status
+    return status
+
+
+def skip_suites(testsuites, summary="Interrupted by user"):
+    """
+    Mark the testsuites which were not run Not_Run
+    """
+    for testsuite in testsuites:
+        if testsuite.runsummary is not None:
+            continue
+        testsuite.runstatus(Testsuite_status.Not_Run.value, summary)
+        with count_lock:
+            count_testsuites_status[Testsuite_status.Not_Run.value] += 1
+
+
+def run_suites(testsuites, avocado_bin, runner, linux_src_path):
+    """
+    Run the given testsuites one after other, until Ctrl-C
+    :param testsuites: List of Testsuite objects to run
+    """
+    try:
+        for testsuite in testsuites:
+            if run_interrupted.is_set():
+                break
+            deadline = start_suite_deadline(testsuite, testsuites)
+            if deadline and time.time() >= deadline:
+                skip_suites([testsuite], "Suite timed out")
+                continue
+            run_test(testsuite, avocado_bin, runner, linux_src_path)
+            if args.interval and not run_interrupted.is_set():
+                time.sleep(int(args.interval))
+    except KeyboardInterrupt:
+        # Ctrl-C outside of a job, ex: while capturing coverage
+        run_interrupted.set()
+    skip_suites(testsuites)
+
+
+def order_by_duration(groups):
+    """
+    Order groups of testsuites longest first, from the durations of their
+    past runs in the results store
+
+    Suites without history are estimated with the average duration of the
+    known ones. Without any history, the order is left as is.
+    :param groups: List of lists of Testsuite objects run one after other
+    :return: Reordered list of groups
+    """
+    if results_db is None:
+        return groups
+    try:
+        durations = results_db.suite_durations(
+            [testsuite.name for group in groups for testsuite in group])
+    except sqlite3.Error as error:
+        logger.debug("Unable to read suite durations: %s", error)
+        return groups
+    if not durations:
+        return groups
+    default = sum(durations.values()) / len(durations)
+
+    def group_duration(group):
+        return sum(durations.get(testsuite.name, default) for testsuite in group)
+
+    groups = sorted(groups, key=group_duration, reverse=True)
+    logger.debug("Suite order by expected duration: %s",
+                 ", ".join("%s (%ds)" % (group[0].name, group_duration(group))
+                           for group in groups))
+    return groups
+
+
+def run_suites_parallel(testsuites, avocado_bin, runner, workers):
+    """
+    Run the given testsuites concurrently in a pool of workers
+
+    The tests of a host suite share its input file section and devices, so
+    they are run one after other within a single worker, and so are the
+    host suites of a same resource, ex: tests of one adapter. Guest suites
+    share the guest VM and depend on guest_install, so they make a single
+    job too. Jobs are started longest first.
+    Ctrl-C interrupts the running jobs and skips the ones not started.
+    :param testsuites: List of Testsuite objects to run
+    :param workers: Number of suites to run at a time
+    """
+    guest_suites = [_ for _ in testsuites if _.type == 'guest']
+    host_suites = [_ for _ in testsuites if _.type != 'guest']
+    logger.info("Running %s test suites with %s parallel workers",
+                len(testsuites), workers)
+    groups = []
+    resource_groups = {}
+    for testsuite in host_suites:
+        key = testsuite.resource or testsuite.suite
+        if key in resource_groups:
+            resource_groups[key].append(testsuite)
+        else:
+            resource_groups[key] = [testsuite]
+            groups.append(resource_groups[key])
+    if guest_suites:
+        groups.append(guest_suites)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = []
+        # The pool takes jobs in submission order, so submitting the longest
+        # first keeps long suites from being left to the end
+        for group in order_by_duration(groups):
+            jobs.append((pool.submit(run_suites, group, avocado_bin,
+                                     runner, None), group))
+        for job, _ in jobs:
+            while not job.cancelled():
+                try:
+                    job.result()
+                    break
+                except KeyboardInterrupt:
+                    # Ctrl-C reaches this thread only, the jobs run in their
+                    # own sessions
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    interrupt_jobs()
+                except Exception:
+                    # leave the queued jobs, the running ones are waited for
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+    for job, group in jobs:
+        if job.cancelled():
+            skip_suites(group)
+
+
+def fleet_command(remote_dir, options, extra_args):
+    """
+    Build the avocado-setup.py command line to run on a fleet host
+    :param remote_dir: Wrapper dir on the host
+    :param options: Options of this run to pass on, see FLEET_RUN_OPTIONS
+    :param extra_args: Further arguments
+    """
+    cmd = ['python3', 'avocado-setup.py'] + extra_args
+    for attr, option, has_value in options:
+        value = getattr(args, attr)
+        # 0 is a value, ex: --sample-interval 0
+        if value is None or value is False or value == '':
+            continue
+        cmd.append(option)
+        if has_value:
+            cmd.append(str(value))
+    return "cd %s && %s" % (shlex.quote(remote_dir), ' '.join(shlex.quote(_) for _ in cmd))
+
+
+def create_fleet_tarball():
+    """
+    Pack the wrapper, without test repos, data and results, along with the
+    test configs generated by this run, to be unpacked on the fleet hosts
+    :return: path of the tarball
+    """
+    excludes = set()
+    for path in (TEST_DIR, DATA_DIR, CACHE_DIR, os.path.join(BASE_PATH, 'results'),
+                 os.path.join(BASE_PATH, '.git')):
+        excludes.add(os.path.relpath(path, BASE_PATH))
+
+    def exclude(tarinfo):
+        name = os.path.normpath(tarinfo.name)
+        if name in excludes or name.endswith('.log'):
+            return None
+        return tarinfo
+
+    tarball = os.path.join(RUN_DIR, 'wrapper.tar.gz')
+    with tarfile.open(tarball, 'w:gz') as tar:
+        for name in os.listdir(BASE_PATH):
+            tar.add(os.path.join(BASE_PATH, name), arcname=name, filter=exclude)
+        conf_dir = os.path.relpath(TEST_CONF_PATH, BASE_PATH)
+        for cfg in glob.glob(os.path.join(RUN_DIR, '*', '*.cfg')):
+            tar.add(cfg, arcname=os.path.join(conf_dir, os.path.relpath(cfg, RUN_DIR)))
+    return tarball
+
+
+def fleet_setup(runner, tarball):
+    """
+    Unpack the wrapper on a fleet host and bootstrap it
+    :return: list of arguments passing the input files of this run, None
+             if the host could not be set up
+    """
+    remote_dir = args.fleet_dir
+    status, output = runner.runcmd("mkdir -p %s/fleet-inputs" % shlex.quote(remote_dir),
+                                   ignore_status=True)
+    if status == 0:
+        status, output = runner.copy_to(tarball, "%s/wrapper.tar.gz" % remote_dir,
+                                        ignore_status=True)
+    if status == 0:
+        status, output = runner.runcmd("cd %s && tar xzf wrapper.tar.gz && rm -f wrapper.tar.gz"
+                                       % shlex.quote(remote_dir), ignore_status=True)
+    input_args = []
+    for attr, option in (('inputfile', '--input-file'), ('CONFIG_PATH', '--config-env'),
+                         ('NORUNTEST_PATH', '--config-norun')):
+        local_path = getattr(args, attr)
+        if status != 0 or not local_path:
+            continue
+        remote_path = "fleet-inputs/%s" % os.path.basename(local_path)
+        status, output = runner.copy_to(local_path, "%s/%s" % (remote_dir, remote_path),
+                                        ignore_status=True)
+        input_args.extend([option, remote_path])
+    if status != 0:
+        logger.error("Fleet host %s setup failed: %s", runner.host, output)
+        return None
+    logger.info("Bootstrapping fleet host %s", runner.host)
+    cmd = fleet_command(remote_dir, FLEET_BOOTSTRAP_OPTIONS,
+                        ['--bootstrap', '--incremental-bootstrap'] + input_args)
+    status, output = runner.runcmd(cmd, ignore_status=True)
+    if status != 0:
+        logger.error("Fleet host %s bootstrap failed: %s", runner.host, output)
+        return None
+    return input_args
+
+
+def save_run_summary(Testsuites, Testsuites_list):
+    """
+    Record the final status and summary of every testsuite of the run in
+    its results dir, for the fleet host running it
+    """
+    summary = []
+    for name in Testsuites_list:
+        testsuite = Testsuites[name]
+        job_dir = testsuite.job_dir
+        summary.append({'name': testsuite.name, 'run': testsuite.run,
+                        'summary': testsuite.runsummary,
+                        'job_dir': os.path.relpath(job_dir, outputdir) if job_dir else None})
+    try:
+        helper.save_json(os.path.join(outputdir, RUN_SUMMARY_FILE), summary)
+    except OSError as error:
+        logger.debug("Unable to save run summary in %s: %s", outputdir, error)
+
+
+def add_fleet_job(host, job_dir, fleet_suites, status=Testsuite_status.Run.value,
+                  summary="Successfully executed", name=None):
+    """
+    Add a job copied back from a fleet host to the results of the run
+    """
+    result_file = os.path.join(job_dir, "results.json")
+    info = helper.load_json(os.path.join(job_dir, SUITE_INFO_FILE), {})
+    if info:
+        # the jobs of all the hosts belong to this run
+        info['run_id'] = RUN_ID
+        try:
+            helper.save_json(os.path.join(job_dir, SUITE_INFO_FILE), info)
+        except OSError as error:
+            logger.debug("Unable to save suite info in %s: %s", job_dir, error)
+    name = name or info.get('name') or os.path.basename(job_dir)
+    testsuite = TestSuite(name, os.path.dirname(job_dir), args.vt_type,
+                          info.get('test'), None, info.get('args'),
+                          tempmux=info.get('mux'))
+    testsuite.job_dir = job_dir
+    try:
+        collect_results(testsuite, job_dir, status, summary)
+    except (OSError, ValueError) as error:
+        logger.error("Unable to read results %s of %s: %s", result_file, host, error)
+        testsuite.runstatus(Testsuite_status.Not_Run.value,
+                            "Unable to read results from %s" % host)
+        with count_lock:
+            count_testsuites_status[Testsuite_status.Not_Run.value] += 1
+    fleet_suites.append(testsuite)
+
+
+def collect_fleet_results(host, unit, results_dir, fleet_suites):
+    """
+    Add the testsuites run on a fleet host to the results of the run,
+    with the status the host gave them
+    :param host: Fleet host name
+    :param unit: Suite names run on the host
+    :param results_dir: Local copy of the results dir of the host
+    :param fleet_suites: list the Testsuite objects of the jobs are added to
+    """
+    run_summary = helper.load_json(os.path.join(results_dir, RUN_SUMMARY_FILE))
+    if run_summary:
+        for entry in run_summary:
+            job_dir = os.path.join(results_dir, entry['job_dir']) if entry.get('job_dir') else None
+            if job_dir and os.path.isfile(os.path.join(job_dir, "results.json")):
+                add_fleet_job(host, job_dir, fleet_suites, entry['run'], entry['summary'],
+                              entry['name'])
+                continue
+            testsuite = TestSuite(entry['name'], results_dir, args.vt_type)
+            testsuite.job_dir = job_dir
+            testsuite.runstatus(entry['run'], entry['summary'],
+                                job_dir + "/job.log" if job_dir else '')
+            with count_lock:
+                count_testsuites_status[entry['run']] += 1
+            fleet_suites.append(testsuite)
+        return
+    # the host run did not finish, count whatever jobs it left
+    result_files = find_result_files(results_dir) if os.path.isdir(results_dir) else []
+    for result_file in result_files:
+        add_fleet_job(host, os.path.dirname(result_file), fleet_suites)
+    if not result_files:
+        for name in unit:
+            testsuite = TestSuite(name, results_dir, args.vt_type)
+            testsuite.runstatus(Testsuite_status.Not_Run.value,
+                                "No results from %s" % host)
+            with count_lock:
+                count_testsuites_status[Testsuite_status.Not_Run.value] += 1
+            fleet_suites.append(testsuite)
+
+
+def fetch_fleet_results(runner, remote_out, local_out):
+    """
+    Copy the results dir of a unit back from a fleet host, as a tarball so
+    that the latest symlinks of avocado are not copied as job dirs
+    :return: True if the results were copied
+    """
+    remote_dir = "%s/%s" % (args.fleet_dir, remote_out)
+    status, output = runner.runcmd("cd %s && tar czf results.tar.gz results"
+                                   % shlex.quote(remote_dir), ignore_status=True)
+    local_tar = os.path.join(local_out, 'results.tar.gz')
+    if status == 0:
+        status, output = runner.copy_from("%s/results.tar.gz" % remote_dir, local_tar,
+                                          ignore_status=True)
+    if status != 0:
+        logger.debug("Unable to copy results of %s from %s: %s", remote_out,
+                     runner.host, output)
+        return False
+    try:
+        with tarfile.open(local_tar) as tar:
+            if hasattr(tarfile, 'data_filter'):
+                tar.extractall(local_out, filter='data')
+            else:
+                tar.extractall(local_out)
+    except (OSError, tarfile.TarError) as error:
+        logger.error("Unable to unpack results of %s from %s: %s", remote_out,
+                     runner.host, error)
+        return False
+    finally:
+        if os.path.exists(local_tar):
+            os.remove(local_tar)
+    return True
+
+
+def fleet_worker(runner, tarball, units, units_lock, outputdir, fleet_suites):
+    """
+    Set up a fleet host, then run units of suites on it until none is left.
+    A host found unreachable puts its unit back for the other hosts and
+    takes no more.
+    """
+    input_args = fleet_setup(runner, tarball)
+    if input_args is None:
+        return
+    while True:
+        with units_lock:
+            if not units:
+                return
+            index, unit = units.pop(0)
+        remote_out = "fleet-results/%s" % index
+        logger.info("Running %s on %s", ','.join(unit), runner.host)
+        runner.runcmd("cd %s && rm -rf %s && mkdir -p %s" % (shlex.quote(args.fleet_dir),
+                                                             remote_out, remote_out),
+                      ignore_status=True)
+        cmd = fleet_command(args.fleet_dir, FLEET_RUN_OPTIONS,
+                            ['--run-suite', ','.join(unit), '--output-dir', remote_out] +
+                            input_args)
+        status, _ = runner.runcmd(cmd, ignore_status=True)
+        if status != 0:
+            logger.warning("%s exited with status %s on %s", ','.join(unit), status,
+                           runner.host)
+        local_out = os.path.join(outputdir, 'fleet', runner.host, str(index))
+        os.makedirs(local_out, exist_ok=True)
+        fetched = fetch_fleet_results(runner, remote_out, local_out)
+        # ssh exits with 255 when the connection fails
+        if (status == 255 or not fetched) and \
+                runner.runcmd("true", ignore_status=True)[0] != 0:
+            logger.error("Fleet host %s is unreachable, leaving %s to the other hosts",
+                         runner.host, ','.join(unit))
+            with units_lock:
+                units.insert(0, (index, unit))
+            return
+        unit_suites = []
+        collect_fleet_results(runner.host, unit, os.path.join(local_out, 'results'),
+                              unit_suites)
+        with units_lock:
+            fleet_suites[index] = unit_suites
+
+
+def run_fleet(test_suites, outputdir):
+    """
+    Run the given suites across the fleet hosts
+
+    Every host suite is a unit of work, and the guest suites, which share
+    the guest VM, make one unit together. Each host is set up and
+    bootstrapped once, then takes the next unit left until all are run.
+    The results of each unit are copied back under <outputdir>/fleet as
+    soon as it is done.
+    :param test_suites: Suite names, ex: host_sanity
+    :param outputdir: Local results dir
+    :return: dict of name and Testsuite object of each job run, and the
+             list of names in run order
+    """
+    hosts = list(filter(None, args.fleet_hosts.split(',')))
+    units = [[_] for _ in test_suites if not _.startswith('guest_')]
+    guest_suites = [_ for _ in test_suites if _.startswith('guest_')]
+    if guest_suites:
+        units.insert(0, guest_suites)
+    units = list(enumerate(units))
+    pending = list(units)
+    runners = [helper.RemoteRunner(host, args.fleet_user, args.fleet_password)
+               for host in hosts]
+    tarball = create_fleet_tarball()
+    fleet_suites = {}
+    units_lock = threading.Lock()
+    logger.info("Running %s suites on %s fleet hosts", len(units), len(hosts))
+    with ThreadPoolExecutor(max_workers=len(runners)) as pool:
+        jobs = [pool.submit(fleet_worker, runner, tarball, pending, units_lock,
+                            outputdir, fleet_suites) for runner in runners]
+        for job in jobs:
+            job.result()
+    for index, unit in pending:
+        unit_suites = fleet_suites.setdefault(index, [])
+        for name in unit:
+            testsuite = TestSuite(name, outputdir, args.vt_type)
+            testsuite.runstatus(Testsuite_status.Not_Run.value, "No fleet host available")
+            count_testsuites_status[Testsuite_status.Not_Run.value] += 1
+            unit_suites.append(testsuite)
+    Testsuites = {}
+    Testsuites_list = []
+    for index, _ in units:
+        for testsuite in fleet_suites.get(index, []):
+            name = testsuite.name
+            while name in Testsuites:
+                name += '_'
+            Testsuites[name] = testsuite
+            Testsuites_list.append(name)
+    return Testsuites, Testsuites_list
 
 
 def env_clean(deep=False):
@@ -490,6 +1715,9 @@ def env_clean(deep=False):
     """
     logger.info("Cleaning the Environment")
     pipManager.uninstall()
+    manifest = os.path.join(CACHE_DIR, BOOTSTRAP_MANIFEST)
+    if os.path.isfile(manifest):
+        os.remove(manifest)
     if os.path.isdir(prescript):
         helper.remove_file(prescript, prescript_dir)
 
@@ -507,38 +1735,369 @@ def env_clean(deep=False):
             shutil.rmtree(TEST_DIR)
 
 
-def edit_mux_file(test_config_name, mux_file_path, tmp_mux_path):
+def get_input_sections():
+    """
+    Parse the input file once per run
+    :return: dict of section name and dict of its keys and values
+    """
+    global input_sections
+    if input_sections is None:
+        INPUTFILE.read(args.inputfile)
+        input_sections = {section: dict(INPUTFILE.items(section))
+                          for section in INPUTFILE.sections()}
+    return input_sections
+
+
+def edit_mux_file(test_config_name, mux_file_path):
     """
     Edit the mux file with input given in  input config file.
+
+    Edited files are kept in a cache keyed by the content of the mux file
+    and of the input file section, so an unchanged combination is reused
+    across runs, and within a run a mux file is looked up only once for a
+    given input file section.
+    :return: path of the edited mux file
     """
-    INPUTFILE.read(args.inputfile)
-    if INPUTFILE.has_section(test_config_name):
-        input_dic = {}
-        for input_line in INPUTFILE.items(test_config_name):
-            input_dic[input_line[0]] = input_line[1]
-    else:
+    memo_key = (mux_file_path, test_config_name)
+    if memo_key in edited_mux_files:
+        return edited_mux_files[memo_key]
+    input_dic = get_input_sections().get(test_config_name)
+    if input_dic is None:
         logger.debug("Section %s not found in input file", test_config_name)
-        shutil.copyfile(mux_file_path, tmp_mux_path)
-        return
+        edited_mux_files[memo_key] = mux_file_path
+        return mux_file_path
 
     with open(mux_file_path) as mux_fp:
         mux_str = mux_fp.read()
+    cached_mux = os.path.join(CACHE_DIR, 'mux', "%s.yaml" % helper.digest([mux_str, input_dic]))
+    edited_mux_files[memo_key] = cached_mux
+    if os.path.isfile(cached_mux):
+        # mark it as recently used, for the cache eviction
+        os.utime(cached_mux)
+        return cached_mux
 
     mux_str_edited = []
     for line in mux_str.splitlines():
         if len(line) == 0 or line.lstrip()[0] == '#':
             continue
-        for key, value in input_dic.items():
-            temp_line = line.split(":")
-            mux_key = temp_line[0]
-            mux_value = temp_line[1]
-            if key == mux_key.strip():
-                line = line.replace('%s' % line.strip(),
-                                    '%s: %s' % (key, value))
+        key = line.split(":")[0].strip()
+        if ":" in line and key in input_dic:
+            line = line.replace('%s' % line.strip(),
+                                '%s: %s' % (key, input_dic[key]))
         mux_str_edited.append(line)
 
+    os.makedirs(os.path.dirname(cached_mux), exist_ok=True)
+    tmp_mux_path = "%s.%s.tmp" % (cached_mux, os.getpid())
     with open(tmp_mux_path, 'w') as mux_fp:
         mux_fp.write(str("\n".join(mux_str_edited)))
+    os.replace(tmp_mux_path, cached_mux)
+    return cached_mux
+
+
+def _test_matches_reference(reference, test_id):
+    """
+    Check if the test listed by avocado is one selected by the reference
+    """
+    ref_path, _, ref_filter = reference.partition(':')
+    test_path, _, test_name = test_id.partition(':')
+    if test_path != ref_path:
+        return False
+    return not ref_filter or re.search(ref_filter, test_name) is not None
+
+
+def _resolve_in_process(references):
+    """
+    Resolve test references with the avocado resolver of this interpreter
+    :return: set of resolved references, None if avocado is not importable
+    """
+    try:
+        from avocado.core import resolver
+        from avocado.core.settings import settings
+        resolutions = resolver.resolve(references, config=settings.as_dict())
+    except Exception as error:
+        logger.debug("In-process test resolution not available: %s", error)
+        return None
+    return {res.reference for res in resolutions
+            if res.result == resolver.ReferenceResolutionResult.SUCCESS}
+
+
+def _resolve_with_avocado_list(avocado_bin, references):
+    """
+    Resolve test references with one `avocado list` for all of them,
+    references missing from its output are rechecked one by one
+    :return: set of resolved references
+    """
+    resolved = set()
+    cmd = "%s list %s 2> /dev/null" % (avocado_bin,
+                                       " ".join(shlex.quote(_) for _ in references))
+    status, output = helper.runcmd(cmd, ignore_status=True)
+    if status == 0:
+        test_ids = [line.split()[1] for line in output.splitlines()
+                    if len(line.split()) > 1]
+        for reference in references:
+            if any(_test_matches_reference(reference, test_id) for test_id in test_ids):
+                resolved.add(reference)
+    for reference in references:
+        if reference in resolved:
+            continue
+        cmd = "%s list %s 2> /dev/null" % (avocado_bin, shlex.quote(reference))
+        if helper.runcmd(cmd, ignore_status=True)[0] == 0:
+            resolved.add(reference)
+    return resolved
+
+
+def resolve_test_references(avocado_bin, references):
+    """
+    Find which of the given test references can be resolved by avocado.
+
+    References are resolved in a single batch, in-process when avocado is
+    importable, else with one `avocado list`. Resolved references are
+    cached on disk per test repository and its git HEAD, so later runs
+    against the same checkout skip their resolution. Failed ones are always
+    resolved again, the test may be added without a commit.
+    :param avocado_bin: Executable path of avocado
+    :param references: list of test references
+    :return: set of references that can be resolved
+    """
+    cache_file = os.path.join(CACHE_DIR, "test_resolution.json")
+    # repo name -> {'head': HEAD of the checkout, 'refs': {reference: True}}
+    cache = {repo_name: entry for repo_name, entry in helper.load_json(cache_file, {}).items()
+             if isinstance(entry, dict) and 'head' in entry}
+    repo_heads = {}
+    resolved = set()
+    pending = []
+    for reference in set(references):
+        repo_name = os.path.relpath(reference, TEST_DIR).split(os.sep)[0]
+        if repo_name not in repo_heads:
+            repo_heads[repo_name] = helper.get_git_head(os.path.join(TEST_DIR, repo_name))
+            # forget the resolutions of an older checkout of the repo
+            if cache.get(repo_name, {}).get('head') != repo_heads[repo_name]:
+                cache.pop(repo_name, None)
+        head = repo_heads[repo_name]
+        if head and cache.get(repo_name, {}).get('refs', {}).get(reference):
+            resolved.add(reference)
+            continue
+        pending.append((reference, repo_name, head))
+    if not pending:
+        return resolved
+
+    logger.debug("Resolving %s test references", len(pending))
+    pending_refs = [_[0] for _ in pending]
+    newly_resolved = _resolve_in_process(pending_refs)
+    if newly_resolved is None:
+        newly_resolved = _resolve_with_avocado_list(avocado_bin, pending_refs)
+    resolved.update(newly_resolved)
+
+    for reference, repo_name, head in pending:
+        if head and reference in newly_resolved:
+            entry = cache.setdefault(repo_name, {'head': head, 'refs': {}})
+            entry['refs'][reference] = True
+    try:
+        helper.save_json(cache_file, cache)
+    except OSError as error:
+        logger.debug("Unable to save test resolution cache: %s", error)
+    return resolved
+
+
+class NoRunFilter:
+    """
+    Compiled entries of the no run config: exact <test yaml> lines are
+    kept in a set and <string*> patterns in a prefix trie, so matching a
+    line does not depend on the number of entries
+    """
+
+    # Marks the end of a pattern in the trie
+    END = None
+
+    def __init__(self, entries):
+        self.exact = set()
+        self.trie = {}
+        for entry in filter(None, entries):
+            if entry.endswith('*'):
+                node = self.trie
+                for char in entry[:-1]:
+                    node = node.setdefault(char, {})
+                node[self.END] = True
+            else:
+                self.exact.add(entry)
+
+    def __contains__(self, line):
+        if line in self.exact:
+            return True
+        node = self.trie
+        for char in line:
+            if self.END in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return self.END in node
+
+
+def get_norun_filter(enable_kvm):
+    """
+    Return the no run filter of this environment, compiled once per run
+    """
+    (env_ver, env_type, _) = helper.get_env_type(enable_kvm)
+    # Get common set of not needed tests
+    env = 'norun_%s' % env_type
+    dist = 'norun_%s' % helper.get_dist()[0]
+    major = 'norun_%s' % env_ver.split('.')[0]
+    minor = 'norun_%s' % env_ver
+    minor_env = 'norun_%s_%s' % (env_ver, env_type)
+    sections = (env, dist, major, minor, minor_env)
+    if sections not in norun_filters:
+        norun_tests = []
+        for section in sections:
+            if NORUNTESTFILE.has_section(section):
+                norun_tests.extend(NORUNTESTFILE.get(
+                    section, 'tests').split(','))
+        norun_filters[sections] = NoRunFilter(norun_tests)
+    return norun_filters[sections]
+
+
+def get_test_config_file(test_config_type, test_config_name):
+    """
+    Return the path of a test config file, suites generated by this run
+    are looked up in the run dir first
+    """
+    cfg_name = "%s.cfg" % test_config_name
+    if RUN_DIR:
+        run_cfg = os.path.join(RUN_DIR, test_config_type, cfg_name)
+        if os.path.isfile(run_cfg):
+            return run_cfg
+    return os.path.join(TEST_CONF_PATH, test_config_type, cfg_name)
+
+
+def get_repo_heads():
+    """
+    Return the commit checked out in each test repo
+    """
+    heads = {}
+    for repo in TEST_REPOS:
+        repo_name = repo[0].split('/')[-1].split('.')[0]
+        head = helper.get_git_head(os.path.join(TEST_DIR, repo_name))
+        if head:
+            heads[repo_name] = head
+    return heads
+
+
+def get_changed_files(repo_name, base):
+    """
+    Return the files of the test repo changed since the given commit,
+    None when they cannot be told
+    """
+    if (repo_name, base) not in changed_files_cache:
+        cmd = "git -C %s diff --name-only %s" % (shlex.quote(os.path.join(TEST_DIR, repo_name)),
+                                                 shlex.quote(base))
+        status, output = helper.runcmd(cmd, ignore_status=True)
+        changed_files_cache[(repo_name, base)] = set(output.split()) if status == 0 else None
+    return changed_files_cache[(repo_name, base)]
+
+
+def is_cfg_entry_changed(line, base_heads):
+    """
+    Tell whether the test or mux file of a cfg entry changed since the
+    given repo commits, a test also changes with its .py.data dir
+    :param line: Split cfg line
+    :param base_heads: dict of test repo name and commit
+    """
+    paths = [line[0].strip('$').split(':')[0]]
+    if len(line) > 1 and '.yaml' in line[1]:
+        paths.append(line[1])
+    for path in paths:
+        repo_name, _, repo_path = path.partition('/')
+        if repo_name not in base_heads:
+            return True
+        changed = get_changed_files(repo_name, base_heads[repo_name])
+        if changed is None:
+            return True
+        if repo_path in changed:
+            return True
+        data_dir = "%s.data/" % repo_path
+        if repo_path.endswith('.py') and any(_.startswith(data_dir) for _ in changed):
+            return True
+    return False
+
+
+def select_changed(test_suite, cfg_tests):
+    """
+    Keep the cfg entries of the suite which changed since its last fully
+    passing run, new entries and those matching --always-run
+    :param test_suite: Suite name, ex: host_sanity
+    :param cfg_tests: List of split cfg line and test dict tuples
+    :return: selected tuples
+    """
+    last_pass = helper.load_json(os.path.join(CACHE_DIR, LAST_PASS_FILE), {}).get(test_suite)
+    if not last_pass:
+        logger.info("No passing run of %s recorded, running all its tests", test_suite)
+        return cfg_tests
+    always_run = list(filter(None, args.always_run.split(',')))
+    passed_entries = set(last_pass['entries'])
+    selected = []
+    for line, test_dic in cfg_tests:
+        if (test_dic['entry'] not in passed_entries or
+                any(fnmatch.fnmatch(line[0], _) for _ in always_run) or
+                is_cfg_entry_changed(line, last_pass['repos'])):
+            selected.append((line, test_dic))
+    logger.info("%s: running %s of %s tests changed since its last passing run",
+                test_suite, len(selected), len(cfg_tests))
+    return selected
+
+
+def save_last_pass(test_suites, Testsuites, suite_members):
+    """
+    Record the test repo commits and cfg entries of the host suites whose
+    tests all passed in this run
+    :param test_suites: Suite names of the run, ex: host_sanity
+    :param Testsuites: dict of name and Testsuite object
+    :param suite_members: dict of suite name and names of its Testsuite objects
+    """
+    last_pass_file = os.path.join(CACHE_DIR, LAST_PASS_FILE)
+    last_pass = helper.load_json(last_pass_file, {})
+    heads = None
+    for test_suite in test_suites:
+        members = [Testsuites[_] for _ in suite_members.get(test_suite, [])]
+        if test_suite not in suite_cfg_entries or not members:
+            continue
+        if not all(_.run == Testsuite_status.Run.value and _.result_state and
+                   not any(_.result_state.get(key) for key in ('errors', 'failures', 'interrupt'))
+                   for _ in members):
+            continue
+        if heads is None:
+            heads = get_repo_heads()
+        last_pass[test_suite] = {'repos': heads, 'entries': suite_cfg_entries[test_suite]}
+        logger.debug("Recorded passing run of %s", test_suite)
+    if heads is not None:
+        helper.save_json(last_pass_file, last_pass)
+
+
+def get_cfg_tags(test_config_file):
+    """
+    Read the tags of a test config file, given in its leading comment
+    lines as "# <tag>: <value>", ex: "# pci_root: 0001:01"
+    :param test_config_file: Suite name, ex: host_io_nvme_0001_01_fvt
+    :return: dict of tag and value
+    """
+    test_config_type, _, test_config_name = test_config_file.partition('_')
+    tags = {}
+    cfg_file = get_test_config_file(test_config_type, test_config_name)
+    if not os.path.isfile(cfg_file):
+        return tags
+    with open(cfg_file, 'r') as filep:
+        for line in filep:
+            if not line.startswith('#'):
+                break
+            match = CFG_TAG.match(line)
+            if not match:
+                continue
+            tag, value = match.groups()
+            if tag in ('timeout', 'test_timeout') and not value.isdigit():
+                logger.warning("Ignoring %s tag of %s, %s is not seconds",
+                               tag, cfg_file, value)
+                continue
+            tags[tag] = value
+    return tags
 
 
 def parse_test_config(test_config_file, avocado_bin, enable_kvm, runner):
@@ -548,26 +2107,16 @@ def parse_test_config(test_config_file, avocado_bin, enable_kvm, runner):
     """
     test_config_type = test_config_file[:test_config_file.find("_")]
     test_config_name = test_config_file[test_config_file.find("_") + 1:]
-    test_config_file = "%s/%s/%s.cfg" % (TEST_CONF_PATH, test_config_type,
-                                         test_config_name)
+    test_config_file = get_test_config_file(test_config_type, test_config_name)
     if os.path.isfile(test_config_file):
-        (env_ver, env_type, _) = helper.get_env_type(enable_kvm)
-        norun_tests = []
-        # Get common set of not needed tests
-        env = 'norun_%s' % env_type
-        dist = 'norun_%s' % helper.get_dist()[0]
-        major = 'norun_%s' % env_ver.split('.')[0]
-        minor = 'norun_%s' % env_ver
-        minor_env = 'norun_%s_%s' % (env_ver, env_type)
-        for section in [env, dist, major, minor, minor_env]:
-            if NORUNTESTFILE.has_section(section):
-                norun_tests.extend(NORUNTESTFILE.get(
-                    section, 'tests').split(','))
-        norun_tests = list(filter(None, norun_tests))
+        norun_filter = get_norun_filter(enable_kvm)
 
         with open(test_config_file, 'r') as filep:
             test_config_contents = filep.read()
         test_list = []
+        # Number of tests in test_list by name, without the .N suffix
+        name_count = {}
+        cfg_tests = []
         mux_flag = 0
         arg_flag = 0
         for line in test_config_contents.splitlines():
@@ -576,18 +2125,17 @@ def parse_test_config(test_config_file, avocado_bin, enable_kvm, runner):
             # Comment line or Empty line filtering
             if line.startswith("#") or not line:
                 norun_flag = True
-            # Filtering <test yaml> combination
-            elif line in norun_tests:
+            # Filtering <test yaml> combination and <string*> pattern
+            elif line in norun_filter:
                 norun_flag = True
-            # Filtering <string*> pattern
-            else:
-                for norun_test in norun_tests:
-                    if norun_test.endswith('*') and line.startswith(norun_test[:-1]):
-                        norun_flag = True
-                        break
             if norun_flag:
                 continue
             # split line ignoring quotes used for additional args
+            # rerun tests keep the input file values of their first run
+            section = test_config_name
+            if test_config_type == 'host' and test_config_name == 'rerun_failed':
+                section = rerun_sections.get(line) or test_config_name
+            test_dic['section'] = section
             line = shlex.split(line)
             test_dic['test'] = os.path.join(TEST_DIR, line[0].strip('$'))
             test_dic['name'] = test_dic['test'].split("/")[-1]
@@ -597,8 +2145,21 @@ def parse_test_config(test_config_file, avocado_bin, enable_kvm, runner):
                 test_dic['test'] = "%s$" % test_dic['test']
             else:
                 test_dic['name'] = test_dic['name'].split(".")[0]
-            cmd = "%s list %s 2> /dev/null" % (avocado_bin, test_dic['test'])
-            if helper.runcmd(cmd, ignore_status=True)[0] != 0:
+            input_section = get_input_sections().get(section) if args.inputfile else None
+            test_dic['entry'] = helper.digest([line, input_section])
+            cfg_tests.append((line, test_dic))
+
+        suite_name = "%s_%s" % (test_config_type, test_config_name)
+        suite_cfg_entries[suite_name] = [_[1]['entry'] for _ in cfg_tests]
+        if args.changed_only and test_config_type == 'host':
+            cfg_tests = select_changed(suite_name, cfg_tests)
+            if not cfg_tests:
+                unchanged_suites.add(suite_name)
+
+        resolved_tests = resolve_test_references(avocado_bin,
+                                                 [_[1]['test'] for _ in cfg_tests])
+        for line, test_dic in cfg_tests:
+            if test_dic['test'] not in resolved_tests:
                 logger.debug("%s does not exist", test_dic['test'])
                 continue
             # Handling parameters after test from cfg
@@ -615,19 +2176,15 @@ def parse_test_config(test_config_file, avocado_bin, enable_kvm, runner):
                         if not os.path.isfile(mux_file):
                             logger.debug("%s does not exist", mux_file)
                             continue
-                        tmp_mux_path = os.path.join('/tmp/mux/', "%s_%s.yaml" % (test_config_name,
-                                                                                 test_dic['name']))
-                        edit_mux_file(test_config_name, mux_file, tmp_mux_path)
-                        test_dic['mux'] = tmp_mux_path
+                        test_dic['mux'] = edit_mux_file(test_dic['section'], mux_file)
                 # Handling additional args from second param
                 else:
                     arg_flag = 1
                     test_dic['args'] = " %s" % line[1]
                     test_dic['tempmux'] = None
-            count = 0
-            for list_dic in test_list:
-                if test_dic['name'] == list_dic['name'].split('.')[0]:
-                    count += 1
+            count = name_count.get(test_dic['name'], 0)
+            name_count[test_dic['name'].split('.')[0]] = name_count.get(
+                test_dic['name'].split('.')[0], 0) + 1
             if count:
                 test_dic['name'] += ".%d" % (count + 1)
             # Handle additional args after yaml(second arg) from third param
@@ -653,6 +2210,22 @@ if __name__ == '__main__':
     parser.add_argument('--bootstrap', dest='bootstrap',
                         action='store_true', default=False,
                         help='Prepare the environment for test')
+    parser.add_argument('--incremental-bootstrap', dest='incremental_bootstrap',
+                        action='store_true', default=False,
+                        help='Redo only the bootstrap stages whose inputs '
+                        'changed since the last bootstrap')
+    parser.add_argument('--wheelhouse', dest='wheelhouse', nargs='?',
+                        action='store', default=None, const='',
+                        help='Install the framework packages in one pip transaction '
+                        'from a local wheel cache dir. Default: cache/wheelhouse')
+    parser.add_argument('--git-mirror', dest='git_mirror',
+                        action='store_true', default=False,
+                        help='Clone test repos borrowing objects from local '
+                        'bare mirrors kept under cache/git-mirrors')
+    parser.add_argument('--sparse-checkout', dest='sparse_checkout',
+                        action='store_true', default=False,
+                        help='Clone test repos partially, checking out only the '
+                        'dirs used by the selected host suites')
     parser.add_argument('--run-suite', dest='run_suite',
                         action='store', default=None,
                         help='Indicate which test suite(s) to run')
@@ -665,6 +2238,34 @@ if __name__ == '__main__':
     parser.add_argument('--input-file', dest='inputfile',
                         action='store', default=None,
                         help='Specify input file for custom mux values for host tests')
+    parser.add_argument('--mux-cache-size', dest='mux_cache_size',
+                        action='store', type=int, default=64,
+                        help='Size limit in MB of the cache of mux files edited '
+                        'with the input file. Default: 64')
+    parser.add_argument('--progress-file', dest='progress_file',
+                        action='store', default=None,
+                        help='Append the start and finish events of every test '
+                        'to the given file, as JSON lines')
+    parser.add_argument('--results-db', dest='results_db',
+                        action='store', default=None,
+                        help='SQLite database to store the results of every suite in. '
+                        'Default: results.db in the cache dir, "none" to disable')
+    parser.add_argument('--suite-timeout', dest='suite_timeout',
+                        action='store', default=None,
+                        help='Seconds a test suite may run before it is stopped and '
+                        'marked Interrupt, or "auto" for %s times its average duration '
+                        'in the results store' % AUTO_TIMEOUT_FACTOR)
+    parser.add_argument('--test-timeout', dest='test_timeout',
+                        action='store', default=None,
+                        help='Seconds each test of a host suite, or a guest suite, may run '
+                        'before it is stopped and marked Interrupt, or "auto" for %s '
+                        'times its average duration in the results store'
+                        % AUTO_TIMEOUT_FACTOR)
+    parser.add_argument('--sample-interval', dest='sample_interval',
+                        action='store', type=float, default=1,
+                        help='Seconds between samples of cpu, memory, disk and network '
+                        'usage saved as resources.csv in each job dir, 0 to disable. '
+                        'Default: 1')
     parser.add_argument('--interval-time', dest='interval',
                         action='store', default=None,
                         help='Specify the interval time between tests')
@@ -689,6 +2290,10 @@ if __name__ == '__main__':
                         action='store', choices=['qemu', 'libvirt'],
                         default='libvirt',
                         help='Provide VT: qemu or libvirt Default: libvirt')
+    parser.add_argument('--guest-overlay', dest='guest_overlay',
+                        action='store_true', default=False,
+                        help='Run each qemu guest suite on a qcow2 copy-on-write '
+                        'overlay of the guest image')
     parser.add_argument('--install', dest='install_guest',
                         action='store_true', default=False,
                         help='Install the Guest VM, if needed.')
@@ -713,9 +2318,40 @@ if __name__ == '__main__':
                         default=None,
                         help='To enable code coverage. Pass the linux source path')
 
+    parser.add_argument('--parallel-suites', dest='parallel_suites',
+                        action='store', type=int, default=1,
+                        help='Number of test suites to run concurrently, '
+                        'each with its own job results dir. Default: 1')
+
     parser.add_argument('--run-tests', dest="run_tests", action='store',
                         default=None,
                         help="To run the host tests provided in the option and publish result [Note: test names(full path) and separated by comma]")
+    parser.add_argument('--rerun-failed', dest='rerun_failed', action='store',
+                        default=None,
+                        help='Results dir of a previous run, or a results.json '
+                        'of it, to run the FAIL, ERROR and INTERRUPTED tests of again')
+    parser.add_argument('--changed-only', dest='changed_only', action='store_true',
+                        default=False,
+                        help='Run only the host tests whose test or yaml files changed '
+                        'in the test repos since the last fully passing run of their suite')
+    parser.add_argument('--always-run', dest='always_run', action='store',
+                        default='',
+                        help='Comma separated patterns of tests run by --changed-only '
+                        'even when unchanged, ex: avocado-misc-tests/cpu/*')
+    parser.add_argument('--fleet-hosts', dest='fleet_hosts', action='store',
+                        default=None,
+                        help='Comma separated hosts to run the suites on over SSH, '
+                        'instead of the local host')
+    parser.add_argument('--fleet-user', dest='fleet_user', action='store',
+                        default='root', help='SSH user of the fleet hosts. Default: root')
+    parser.add_argument('--fleet-password', dest='fleet_password', action='store',
+                        default=os.environ.get('FLEET_PASSWORD', ''),
+                        help='SSH password of the fleet hosts. Default: FLEET_PASSWORD '
+                        'environment variable')
+    parser.add_argument('--fleet-dir', dest='fleet_dir', action='store',
+                        default='avocado-fleet',
+                        help='Dir of the wrapper on the fleet hosts, relative to the '
+                        'home dir of the SSH user. Default: avocado-fleet')
     parser.add_argument('--config-env', dest='CONFIG_PATH',
                         action='store', default=CONFIG_PATH,
                         help='Specify env config path')
@@ -753,6 +2389,7 @@ if __name__ == '__main__':
     globals()['DATA_DIR'] = os.path.join(BASE_PATH, eval(CONFIGFILE.get('paths', 'data_dir')))
     globals()['prescript'] = os.path.join(BASE_PATH, eval(CONFIGFILE.get('paths', 'pre_script_dir')))
     globals()['postscript'] = os.path.join(BASE_PATH, eval(CONFIGFILE.get('paths', 'post_script_dir')))
+    globals()['CACHE_DIR'] = os.path.join(BASE_PATH, eval(CONFIGFILE.get('paths', 'cache_dir', fallback="'cache'")))
     globals()['BASE_FRAMEWORK'] = eval(CONFIGFILE.get('framework', 'base'))
     globals()['KVM_FRAMEWORK'] = eval(CONFIGFILE.get('framework', 'kvm'))
     globals()['OPTIONAL_FRAMEWORK'] = eval(CONFIGFILE.get('framework', 'optional'))
@@ -774,8 +2411,16 @@ if __name__ == '__main__':
                 logger.warning("Overriding user setting and enabling kvm bootstrap "
                                "as guest tests are requested")
                 args.enable_kvm = True
+    for option, value in (('--suite-timeout', args.suite_timeout),
+                          ('--test-timeout', args.test_timeout)):
+        if value and value != 'auto' and not value.isdigit():
+            logger.error("%s takes seconds or auto, not %s", option, value)
+            sys.exit(1)
+    if args.wheelhouse == '':
+        args.wheelhouse = os.path.join(CACHE_DIR, 'wheelhouse')
     pipManager = helper.PipMagager(BASE_FRAMEWORK, OPTIONAL_FRAMEWORK,
-                                   KVM_FRAMEWORK, PIP_PACKAGES, args.enable_kvm)
+                                   KVM_FRAMEWORK, PIP_PACKAGES, args.enable_kvm,
+                                   args.wheelhouse)
     if not (args.run_suite and args.install_deps
             and args.bootstrap and args.install) and args.clean:
         # honor the spl condition, just to deep clean the environment incase needed
@@ -795,32 +2440,80 @@ if __name__ == '__main__':
         outputdir = os.path.join(BASE_PATH, 'results')
 
     bootstraped = False
-    if (args.bootstrap or need_bootstrap(args.enable_kvm)):
-        if not args.no_guest_download and args.enable_kvm:
-            bootstrap(args.enable_kvm, args.guest_os)
-        else:
-            bootstrap(args.enable_kvm)
+    if not args.no_guest_download and args.enable_kvm:
+        bootstrap_guest_os = args.guest_os
+    else:
+        bootstrap_guest_os = None
+    # fleet hosts are bootstrapped on their own
+    if not args.fleet_hosts and (args.bootstrap or
+                                 need_bootstrap(args.enable_kvm, bootstrap_guest_os)):
+        # Bootstrap triggered by need_bootstrap only redoes what changed
+        bootstrap(args.enable_kvm, bootstrap_guest_os,
+                  incremental=args.incremental_bootstrap or not args.bootstrap)
         bootstraped = True
 
+    globals()['progress'] = ProgressTracker(args.progress_file)
+    if args.sample_interval > 0 and not args.fleet_hosts:
+        globals()['sampler'] = ResourceSampler(args.sample_interval,
+                                               int(SAMPLER_WINDOW / args.sample_interval))
+        sampler.start()
+    if args.results_db != 'none':
+        try:
+            globals()['results_db'] = ResultsDB(args.results_db or
+                                                os.path.join(CACHE_DIR, 'results.db'),
+                                                TEST_DIR)
+            globals()['results_run_id'] = results_db.start_run(
+                ' '.join(helper.get_dist()), ' '.join(sys.argv[1:]))
+        except sqlite3.Error as error:
+            logger.warning("Results store disabled: %s", error)
+            globals()['results_db'] = None
+    globals()['RUN_DIR'] = tempfile.mkdtemp(prefix='avocado-setup-')
+    globals()['RUN_ID'] = "%s-%s" % (time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+    atexit.register(shutil.rmtree, RUN_DIR, ignore_errors=True)
+    # Avocado config of this run, ~/.config/avocado may be rewritten by
+    # another run meanwhile
+    globals()['run_config'] = create_config(outputdir, RUN_DIR)
+
     if args.run_tests:
-        with open("%s/host/dynamic_test_suite" % TEST_CONF_PATH+".cfg", "w+") as fp:
+        os.makedirs(os.path.join(RUN_DIR, 'host'), exist_ok=True)
+        with open(os.path.join(RUN_DIR, 'host', 'dynamic_test_suite.cfg'), "w+") as fp:
             fp.write('\n'.join(args.run_tests.split(",")))
         args.run_suite = str(args.run_suite)+","+"host_dynamic_test_suite"
 
+    if args.rerun_failed:
+        if not os.path.exists(args.rerun_failed):
+            logger.error("Results %s to rerun not found", args.rerun_failed)
+            sys.exit(1)
+        rerun_lines, sections, rerun_guest_suites = get_failed_tests(args.rerun_failed)
+        rerun_sections.update(sections)
+        rerun_suites = sorted(rerun_guest_suites)
+        if rerun_lines:
+            os.makedirs(os.path.join(RUN_DIR, 'host'), exist_ok=True)
+            with open(os.path.join(RUN_DIR, 'host', 'rerun_failed.cfg'), "w+") as fp:
+                fp.write('\n'.join(rerun_lines))
+            rerun_suites.append('host_rerun_failed')
+        logger.info("Rerunning %s failed host tests and guest suites %s of %s",
+                    len(rerun_lines), sorted(rerun_guest_suites), args.rerun_failed)
+        if rerun_suites:
+            args.run_suite = ','.join(filter(None, [args.run_suite] + rerun_suites))
+
     if args.inputfile:
         if not os.path.isfile(args.inputfile):
             logger.debug(
                 "Input file %s not found. Continuing without input file", args.inputfile)
             args.inputfile = None
 
+    if args.parallel_suites > 1 and args.linux_src_path:
+        logger.warning("Code coverage capture needs serial run, "
+                       "ignoring --parallel-suites")
+        args.parallel_suites = 1
+    # Concurrent suites must not share a job results dir
+    use_test_dir = args.testdir or args.parallel_suites > 1
+
     if args.run_suite:
-        # create a folder to store all edited multiplexer files
-        if not os.path.isdir("/tmp/mux/"):
-            logger.info("Creating temporary mux dir")
-            os.makedirs("/tmp/mux/")
         if "guest_" in args.run_suite:
             # Make sure we download guest image once
-            if not args.no_guest_download and not bootstraped:
+            if not args.no_guest_download and not bootstraped and not args.fleet_hosts:
                 guest_download(args.guest_os)
             only_filter = args.only_filter
             if only_filter:
@@ -838,56 +2531,84 @@ if __name__ == '__main__':
         if "host_" in args.run_suite:
             TestSuite.host_add_args = additional_args
         test_suites = args.run_suite.split(',')
+        if not args.fleet_hosts:
+            # Check out whatever the selected suites need beyond earlier runs,
+            # with or without --sparse-checkout, full clones are left alone
+            for repo_name, dirs in get_suite_test_paths(test_suites).items():
+                if os.path.isdir(os.path.join(TEST_DIR, repo_name)):
+                    widen_sparse_checkout(os.path.join(TEST_DIR, repo_name), dirs)
         if args.install_guest:
             test_suites.insert(0, 'guest_install')
-        avocado_bin = helper.get_avocado_bin()
-        Testsuites = {}
-        # Validate if given test suite is available
-        # and init TestSuite object for each test suite
-        Testsuites_list = []
-        for test_suite in test_suites:
-            if 'host' in test_suite:
-                test_list = parse_test_config(
-                    test_suite, avocado_bin, args.enable_kvm, args.runner)
-                if not test_list:
-                    Testsuites[test_suite] = TestSuite(test_suite, outputdir,
-                                                       args.vt_type,
-                                                       use_test_dir=args.testdir)
-                    Testsuites[test_suite].runstatus(Testsuite_status.Cant_Run.value,
-                                                     "Config file not present")
-                    count_testsuites_status[Testsuite_status.Cant_Run.value] += 1
-                    Testsuites_list.append(test_suite)
-                    continue
-                for test in test_list:
-                    for l_key in ['mux', 'args']:
-                        if l_key not in test:
-                            test[l_key] = ''
-                    test_suite_name = "%s_%s" % (test_suite, test['name'])
-                    Testsuites[test_suite_name] = TestSuite(test_suite_name,
-                                                            outputdir, args.vt_type,
-                                                            test['test'], test['mux'],
-                                                            test['args'],
-                                                            use_test_dir=args.testdir)
-                    Testsuites_list.append(test_suite_name)
-
-            if 'guest' in test_suite:
-                guest_additional_args = ""
-                Testsuites[test_suite] = TestSuite(str(test_suite),
-                                                   outputdir, args.vt_type,
-                                                   use_test_dir=args.testdir)
-                Testsuites_list.append(str(test_suite))
-                if not Testsuites[test_suite].config():
-                    Testsuites[test_suite].runstatus(Testsuite_status.Cant_Run.value,
-                                                     "Config file not present")
-                    count_testsuites_status[Testsuite_status.Cant_Run.value] += 1
-                    continue
-        # Run Tests
-        count_testsuites_status[Testsuite_status.Total.value] = len(Testsuites_list)
-        for test_suite in Testsuites_list:
-            if not Testsuites[test_suite].run == Testsuite_status.Cant_Run.value:
-                run_test(Testsuites[test_suite], avocado_bin, args.runner, args.linux_src_path)
-                if args.interval:
-                    time.sleep(int(args.interval))
+        if args.fleet_hosts:
+            Testsuites, Testsuites_list = run_fleet(test_suites, outputdir)
+            count_testsuites_status[Testsuite_status.Total.value] = len(Testsuites_list)
+        else:
+            avocado_bin = helper.get_avocado_bin()
+            Testsuites = {}
+            # Validate if given test suite is available
+            # and init TestSuite object for each test suite
+            Testsuites_list = []
+            # Testsuite objects of the tests of each host suite
+            suite_members = {}
+            for test_suite in test_suites:
+                if 'host' in test_suite:
+                    test_list = parse_test_config(
+                        test_suite, avocado_bin, args.enable_kvm, args.runner)
+                    if not test_list:
+                        Testsuites[test_suite] = TestSuite(test_suite, outputdir,
+                                                           args.vt_type,
+                                                           use_test_dir=use_test_dir)
+                        if test_suite in unchanged_suites:
+                            reason = "Unchanged since last passing run"
+                        else:
+                            reason = "Config file not present"
+                        Testsuites[test_suite].runstatus(Testsuite_status.Cant_Run.value,
+                                                         reason)
+                        count_testsuites_status[Testsuite_status.Cant_Run.value] += 1
+                        Testsuites_list.append(test_suite)
+                        continue
+                    cfg_tags = get_cfg_tags(test_suite)
+                    for test in test_list:
+                        for l_key in ['mux', 'args']:
+                            if l_key not in test:
+                                test[l_key] = ''
+                        test_suite_name = "%s_%s" % (test_suite, test['name'])
+                        Testsuites[test_suite_name] = TestSuite(test_suite_name,
+                                                                outputdir, args.vt_type,
+                                                                test['test'], test['mux'],
+                                                                test['args'],
+                                                                use_test_dir=use_test_dir,
+                                                                tempmux=test.get('tempmux'),
+                                                                resource=cfg_tags.get('pci_root'))
+                        Testsuites[test_suite_name].suite_timeout = cfg_tags.get('timeout')
+                        Testsuites[test_suite_name].test_timeout = cfg_tags.get('test_timeout')
+                        Testsuites[test_suite_name].suite = test_suite
+                        Testsuites[test_suite_name].section = test.get('section')
+                        Testsuites_list.append(test_suite_name)
+                        suite_members.setdefault(test_suite, []).append(test_suite_name)
+
+                if 'guest' in test_suite:
+                    guest_additional_args = ""
+                    Testsuites[test_suite] = TestSuite(str(test_suite),
+                                                       outputdir, args.vt_type,
+                                                       use_test_dir=use_test_dir)
+                    Testsuites_list.append(str(test_suite))
+                    if not Testsuites[test_suite].config():
+                        Testsuites[test_suite].runstatus(Testsuite_status.Cant_Run.value,
+                                                         "Config file not present")
+                        count_testsuites_status[Testsuite_status.Cant_Run.value] += 1
+                        continue
+            # Run Tests
+            count_testsuites_status[Testsuite_status.Total.value] = len(Testsuites_list)
+            run_list = [Testsuites[test_suite] for test_suite in Testsuites_list
+                        if not Testsuites[test_suite].run == Testsuite_status.Cant_Run.value]
+            if args.parallel_suites > 1:
+                run_suites_parallel(run_list, avocado_bin, args.runner,
+                                    args.parallel_suites)
+            else:
+                run_suites(run_list, avocado_bin, args.runner, args.linux_src_path)
+            save_last_pass(test_suites, Testsuites, suite_members)
+            save_run_summary(Testsuites, Testsuites_list)
 
         # Finding the space needed for formatting result summary
         test_name_list = []
@@ -924,9 +2645,19 @@ if __name__ == '__main__':
 
         logger.info("\n".join(summary_output))
 
-    if os.path.isdir("/tmp/mux/"):
-        logger.info("Removing temporary mux dir")
-        shutil.rmtree("/tmp/mux/")
+    if sampler is not None:
+        sampler.stop()
+
+    if results_db is not None:
+        try:
+            results_db.end_run(results_run_id, json.dumps(count_result))
+        except sqlite3.Error as error:
+            logger.warning("Unable to store the run summary: %s", error)
+        results_db.close()
+
+    if os.path.isdir(os.path.join(CACHE_DIR, 'mux')):
+        helper.prune_dir(os.path.join(CACHE_DIR, 'mux'), args.mux_cache_size * 1024 * 1024,
+                         min_age=MUX_CACHE_MIN_AGE)
 
     if args.clean:
         env_clean()
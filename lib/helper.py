@@ -14,7 +14,9 @@
 # Helper methods
 # Author: Satheesh Rajendran<sathnaga@linux.vnet.ibm.com>
 
-import itertools
+import functools
+import hashlib
+import json
 import subprocess
 import os
 import re
@@ -22,9 +24,12 @@ import sys
 import shlex
 import shutil
 import stat
+import tempfile
+import threading
 import time
 import platform
 import importlib.metadata
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from .logger import logger_init
 
@@ -65,6 +70,104 @@ def runcmd(cmd, ignore_status=False, err_str="", info_str="", debug_str=""):
     return (status, output)
 
 
+def load_json(path, default=None):
+    """
+    Load the json data stored in the given file
+
+    :param path: Path of the json file
+    :param default: Value to return if the file is missing or unreadable
+
+    :return: Loaded data or default
+    """
+    if not os.path.isfile(path):
+        return default
+    try:
+        with open(path, encoding="utf-8") as filep:
+            return json.load(filep)
+    except (OSError, ValueError) as error:
+        logger.debug("Ignoring unreadable %s: %s", path, error)
+        return default
+
+
+def save_json(path, data):
+    """
+    Store the given data as json, replacing the file atomically so that
+    a concurrent reader never sees a partially written file
+
+    :param path: Path of the json file
+    :param data: Data to be stored
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = "%s.%s.%s.tmp" % (path, os.getpid(), threading.get_ident())
+    with open(tmp_path, 'w', encoding="utf-8") as filep:
+        json.dump(data, filep, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def prune_dir(path, max_bytes, min_age=0):
+    """
+    Evict the least recently modified files of a cache dir until the
+    files take at most max_bytes
+
+    :param path: Cache dir
+    :param max_bytes: Size limit of the cache dir
+    :param min_age: Files modified within these many seconds are kept
+                    even above the limit
+    """
+    entries = []
+    for fle in os.listdir(path):
+        fle = os.path.join(path, fle)
+        if os.path.isfile(fle):
+            stat = os.stat(fle)
+            entries.append((stat.st_mtime, stat.st_size, fle))
+    total = sum(entry[1] for entry in entries)
+    now = time.time()
+    for mtime, size, fle in sorted(entries):
+        if total <= max_bytes or now - mtime < min_age:
+            break
+        try:
+            os.remove(fle)
+        except OSError:
+            continue
+        total -= size
+    logger.debug("Cache dir %s holds %s bytes", path, total)
+
+
+def digest(data):
+    """
+    Return a stable sha256 fingerprint of the given json serializable data
+    """
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def file_digest(path):
+    """
+    Return the sha256 of the content of the given file
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as filep:
+        for chunk in iter(lambda: filep.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_git_head(repo_path):
+    """
+    Return the commit checked out in the given git repository
+
+    :param repo_path: Path of the git repository
+    :return: commit sha, None if it is not a git repository
+    """
+    if not os.path.isdir(os.path.join(repo_path, '.git')):
+        return None
+    status, output = runcmd("git -C %s rev-parse HEAD" % shlex.quote(repo_path),
+                            ignore_status=True)
+    if status != 0:
+        return None
+    return output.strip()
+
+
+@functools.lru_cache(maxsize=None)
 def get_dist():
     """
     Return the distribution
@@ -92,6 +195,7 @@ def get_dist():
     return (dist, dist_ver)
 
 
+@functools.lru_cache(maxsize=None)
 def get_machine_type():
     """
     Return What kind of machine example: pHypLpar/PowerNV/qemu
@@ -115,6 +219,7 @@ def get_machine_type():
     return machine_type
 
 
+@functools.lru_cache(maxsize=None)
 def get_env_type(enable_kvm=False):
     """
     Return what environment the system is: Distro, Version, Type
@@ -132,6 +237,65 @@ def get_env_type(enable_kvm=False):
     return (env_ver, env_type, cmd_pat)
 
 
+class PackageInventory:
+    """
+    Installed packages of the system, captured with a single query of the
+    package database and looked up in memory afterwards
+
+    Usage::
+
+        inventory = PackageInventory()
+        if inventory.loaded and not inventory.has('gcc'):
+            ...
+    """
+
+    def __init__(self, dist=None):
+        """
+        Query the package database of the given distro
+
+        :param dist: Distro name, detected when not given
+        """
+        if not dist:
+            dist = get_dist()[0]
+        self.substring_match = 'ubuntu' in dist
+        if self.substring_match:
+            cmd = "dpkg-query -W -f='${db:Status-Abbrev} ${Package}\\n'"
+        else:
+            cmd = ("rpm -qa --qf '%{NAME} %{NAME}-%{VERSION} "
+                   "%{NAME}-%{VERSION}-%{RELEASE} "
+                   "%{NAME}-%{VERSION}-%{RELEASE}.%{ARCH}\\n'")
+        self.names = set()
+        status, output = runcmd(cmd, ignore_status=True,
+                                debug_str="Collecting installed packages")
+        self.loaded = status == 0
+        if not self.loaded:
+            return
+        for line in output.splitlines():
+            fields = line.split()
+            if self.substring_match:
+                # dpkg lists removed packages too, keep the installed ones
+                if len(fields) == 2 and fields[0] == 'ii':
+                    self.names.add(fields[1].lower())
+            else:
+                self.names.update(fields)
+        self._all_names = "\n".join(sorted(self.names))
+
+    def has(self, package, substring=False):
+        """
+        Check if the given package is installed
+
+        :param package: Package name
+        :param substring: On apt based distros, match any installed package
+                          containing the name, as `apt list | grep` does
+        :return: True if installed
+        """
+        if self.substring_match:
+            package = package.lower()
+            if substring:
+                return package in self._all_names
+        return package in self.names
+
+
 def get_avocado_bin(ignore_status=False):
     """
     Get the avocado executable path
@@ -169,6 +333,44 @@ def install_packages(package_list):
     return not_installed
 
 
+def run_stages(stages, max_workers=None):
+    """
+    Run a set of dependent stages, each stage starts as soon as all the
+    stages it depends on are finished
+
+    :param stages: dict of stage name and a tuple of the function to run
+                   and the list of stage names it depends on
+    :param max_workers: Number of stages to run at a time, default all
+
+    :return: dict of stage name and its run time in seconds
+    """
+    timings = {}
+    start_times = {}
+    pending = dict(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(stages), 1)) as pool:
+        while pending or running:
+            for name, (func, deps) in list(pending.items()):
+                if all(dep in timings for dep in deps):
+                    del pending[name]
+                    start_times[name] = time.time()
+                    running[pool.submit(func)] = name
+            if not running:
+                raise ValueError("Unresolvable stage dependencies: %s" % list(pending))
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for job in done:
+                name = running.pop(job)
+                # re-raise the failure of the stage, leaving the rest undone
+                if job.exception() is not None:
+                    pending.clear()
+                    for other in running:
+                        other.cancel()
+                    job.result()
+                timings[name] = time.time() - start_times[name]
+                logger.debug("Stage %s finished in %.1fs", name, timings[name])
+    return timings
+
+
 def copy_dir_file(src, dest):
     """
     Copy all files from one dir to other dir
@@ -211,10 +413,15 @@ def remove_file(src, dest):
 
 
 class PipMagager:
-    def __init__(self, base_fw=[], opt_fw=[], kvm_fw=[], pip_packages=[], enable_kvm=False):
+    def __init__(self, base_fw=[], opt_fw=[], kvm_fw=[], pip_packages=[], enable_kvm=False,
+                 wheelhouse=None):
         """
         helper class to parse, install, uninstall pip package from user config
+
+        :param wheelhouse: Local wheel cache dir, when given all packages are
+                           installed in a single pip transaction from it
         """
+        self.wheelhouse = wheelhouse
         if sys.version_info[:2] < (3, 6):
             logger.error("System installed python version(%s) not supported, make sure python3.6 or above is installed to proceed" % sys.version_info[:2])
             sys.exit(1)
@@ -246,19 +453,167 @@ class PipMagager:
             else:
                 self.install_packages.append(item[0])
 
-    def install(self):
+    def get_install_cmd(self, packages):
+        """
+        Return the pip command to install the given package specs
+        """
         if os.geteuid() != 0:
             pip_installcmd = '%s install --user -U' % self.pip_cmd
         else:
             pip_installcmd = '%s install -U' % self.pip_cmd
+        cmd = '%s %s' % (pip_installcmd, " ".join(packages))
+        if (self.pip_vmajor > 23) or (self.pip_vmajor == 23 and self.pip_vminor >= 1):
+            cmd = cmd + ' --break-system-packages'  # --break-system-packages introduced in pip 23.1
+        return cmd
+
+    def install(self):
+        if self.wheelhouse:
+            self.install_from_wheelhouse()
+            return
         for package in self.install_packages:
-            cmd = '%s %s' % (pip_installcmd, package)
-            if (self.pip_vmajor > 23) or (self.pip_vmajor == 23 and self.pip_vminor >= 1):
-                cmd = cmd + ' --break-system-packages'  # --break-system-packages introduced in pip 23.1
+            cmd = self.get_install_cmd([shlex.quote(package)])
             runcmd(cmd,
                    err_str='Package installation via pip failed: package  %s' % package,
                    debug_str='Installing python package %s using pip' % package)
 
+    @staticmethod
+    def pin_git_spec(spec):
+        """
+        Pin a git+ package spec to the commit its branch/tag points to
+
+        :param spec: git+ package spec, ex: git+https://host/repo.git@branch#subdirectory=dir
+        :return: (pinned spec, cache key) tuple, key is None if the commit
+                 could not be found
+        """
+        url, _, fragment = spec[len('git+'):].partition('#')
+        ref = ''
+        if '@' in url.split('/')[-1]:
+            url, _, ref = url.rpartition('@')
+        if re.match(r'^[0-9a-f]{40}$', ref):
+            commit = ref
+        else:
+            status, output = runcmd("git ls-remote %s %s" % (url, ref or 'HEAD'),
+                                    ignore_status=True)
+            if status != 0 or not output.strip():
+                return (spec, None)
+            commit = output.split()[0]
+        pinned = "git+%s@%s" % (url, commit)
+        if fragment:
+            pinned += "#%s" % fragment
+        return (pinned, "%s#%s" % (commit, fragment))
+
+    def install_from_wheelhouse(self):
+        """
+        Install all packages in one pip transaction from the local wheelhouse.
+
+        Packages missing in the wheelhouse are added to it first with a single
+        `pip wheel`, git+ specs are built once per commit, so repeated
+        bootstraps install offline from the cache.
+        """
+        os.makedirs(self.wheelhouse, exist_ok=True)
+        index_file = os.path.join(self.wheelhouse, "git-wheels.json")
+        git_wheels = load_json(index_file, {})
+        install_specs = []
+        git_builds = []
+        for item, package in zip(self.installitems, self.install_packages):
+            if not package.startswith('git'):
+                install_specs.append(package)
+                continue
+            pinned, key = self.pin_git_spec(package)
+            wheel = git_wheels.get(key) if key else None
+            # wheels recorded outside git/ may have been overwritten since
+            if wheel and wheel.startswith('git' + os.sep) and \
+                    os.path.isfile(os.path.join(self.wheelhouse, wheel)):
+                install_specs.append(os.path.join(self.wheelhouse, wheel))
+            else:
+                install_specs.append(pinned)
+                git_builds.append((item[0], pinned, key))
+
+        local_cmd = self.get_install_cmd(
+            ["--no-index", "--find-links", shlex.quote(self.wheelhouse)] +
+            [shlex.quote(_) for _ in install_specs])
+        if not git_builds:
+            status, _ = runcmd(local_cmd, ignore_status=True,
+                               debug_str="Installing python packages from %s" % self.wheelhouse)
+            if status == 0:
+                return
+
+        # git+ wheels are named by package version only, which does not
+        # change between commits, so each commit gets its own dir
+        for name, pinned, key in git_builds:
+            wheel = self.build_git_wheel(name, pinned, key)
+            if not wheel:
+                continue
+            if key:
+                git_wheels[key] = wheel
+            install_specs[install_specs.index(pinned)] = os.path.join(self.wheelhouse, wheel)
+        save_json(index_file, git_wheels)
+
+        # Fill the wheelhouse with the other missing wheels and their
+        # dependencies, wheels already cached for a commit need no rebuild
+        missing = [_ for _ in install_specs if not _.startswith(self.wheelhouse)]
+        if missing:
+            cmd = "%s wheel --wheel-dir %s --find-links %s %s" % (
+                self.pip_cmd, shlex.quote(self.wheelhouse), shlex.quote(self.wheelhouse),
+                " ".join(shlex.quote(_) for _ in missing))
+            runcmd(cmd, err_str="Building python package wheels failed:",
+                   debug_str="Adding python packages to wheelhouse %s" % self.wheelhouse)
+
+        local_cmd = self.get_install_cmd(
+            ["--no-index", "--find-links", shlex.quote(self.wheelhouse)] +
+            [shlex.quote(_) for _ in install_specs])
+        runcmd(local_cmd, err_str="Package installation via pip failed:",
+               debug_str="Installing python packages from %s" % self.wheelhouse)
+
+    def build_git_wheel(self, name, pinned, key):
+        """
+        Build the wheel of a git+ package spec into git/<commit>/ of the
+        wheelhouse, the wheels of its dependencies into the wheelhouse
+
+        :param name: Package name
+        :param pinned: git+ spec pinned to a commit
+        :param key: Cache key from pin_git_spec(), None if not pinned
+        :return: path of the wheel relative to the wheelhouse, None if no
+                 wheel was built
+        """
+        commit_dir = os.path.join('git', key.split('#')[0] if key else 'unpinned')
+        os.makedirs(os.path.join(self.wheelhouse, commit_dir), exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix='.build-', dir=self.wheelhouse)
+        try:
+            cmd = "%s wheel --wheel-dir %s --find-links %s %s" % (
+                self.pip_cmd, shlex.quote(build_dir), shlex.quote(self.wheelhouse),
+                shlex.quote(pinned))
+            runcmd(cmd, err_str="Building python package wheels failed:",
+                   debug_str="Adding %s to wheelhouse %s" % (pinned, self.wheelhouse))
+            prefix = "%s-" % re.sub(r"[-_.]+", "_", name).lower()
+            wheel = None
+            for built in os.listdir(build_dir):
+                if built.lower().startswith(prefix) and not wheel:
+                    wheel = os.path.join(commit_dir, built)
+                    os.replace(os.path.join(build_dir, built),
+                               os.path.join(self.wheelhouse, wheel))
+                else:
+                    os.replace(os.path.join(build_dir, built),
+                               os.path.join(self.wheelhouse, built))
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+        if not wheel:
+            logger.debug("No wheel found for %s in %s", pinned, self.wheelhouse)
+        return wheel
+
+    def installed_versions(self):
+        """
+        Return the installed version of each package to be installed,
+        None for the ones not installed
+        """
+        versions = {}
+        for item in self.installitems:
+            try:
+                versions[item[0]] = importlib.metadata.version(item[0])
+            except importlib.metadata.PackageNotFoundError:
+                versions[item[0]] = None
+        return versions
+
     def uninstall(self):
         for package in self.uninstall_packages:
             cmd = '%s uninstall %s -y --disable-pip-version-check' % (self.pip_cmd, package)
@@ -370,6 +725,56 @@ class RemoteRunner:
                 logger.error("%s %s", err_str, error)
             sys.exit(1)
 
+    def _scp(self, src, dest, ignore_status=False, err_str=""):
+        """
+        Copy files recursively with ``sshpass``/``scp``, one of src and
+        dest being a ``user@host:path`` location.
+        """
+        scp_cmd = (
+            "sshpass -p {pwd} scp -r -q {opts} -P {port} "
+            "-o ConnectTimeout={timeout} {src} {dest}"
+        ).format(
+            pwd=shlex.quote(self._password),
+            opts=self._SSH_OPTS,
+            port=self.port,
+            timeout=self.timeout,
+            src=shlex.quote(src),
+            dest=shlex.quote(dest),
+        )
+        logger.debug("Remote(%s) copying %s to %s", self.host, src, dest)
+        status, output = subprocess.getstatusoutput(scp_cmd)
+        if status != 0 and not ignore_status:
+            if err_str:
+                logger.error("%s %s", err_str, output)
+            sys.exit(1)
+        return (status, output)
+
+    def copy_to(self, local_path, remote_path, ignore_status=False, err_str=""):
+        """
+        Copy a local file or dir to the remote host.
+
+        :param local_path: Local file or directory.
+        :param remote_path: Destination path on the remote host.
+        :param ignore_status: If False (default), calls sys.exit(1) on failure.
+        :param err_str: Message to log at ERROR level on failure.
+        :return: (status, output) tuple.
+        """
+        return self._scp(local_path, "%s@%s:%s" % (self.username, self.host, remote_path),
+                         ignore_status, err_str)
+
+    def copy_from(self, remote_path, local_path, ignore_status=False, err_str=""):
+        """
+        Copy a file or dir of the remote host to the local machine.
+
+        :param remote_path: File or directory on the remote host.
+        :param local_path: Local destination path.
+        :param ignore_status: If False (default), calls sys.exit(1) on failure.
+        :param err_str: Message to log at ERROR level on failure.
+        :return: (status, output) tuple.
+        """
+        return self._scp("%s@%s:%s" % (self.username, self.host, remote_path), local_path,
+                         ignore_status, err_str)
+
     def close(self):
         """No persistent connection to close; kept for API compatibility."""
         logger.debug("RemoteRunner.close() called for %s (no-op)", self.host)
@@ -393,51 +798,181 @@ def gcov_reset():
         logger.info("Gcov reset fails")
 
 
+GCOV_DEBUGFS = "/sys/kernel/debug/gcov"
+# source files given to a single gcov run
+GCOV_BATCH = 200
+
+
+def gcov_percent(executed, total):
+    """
+    Percentage of executed lines, rounded the way gcov prints it
+    """
+    percent = round(100.0 * executed / total, 2)
+    if executed and not percent:
+        return 0.01
+    if executed < total and percent == 100:
+        return 99.99
+    return percent
+
+
+def gcov_parse_json(output):
+    """
+    Parse the JSON documents printed by gcov --json-format --stdout
+
+    :param output: gcov stdout, one document per source file
+    :return: dict of source file given to gcov and list of (function,
+             line coverage) of the functions with executable lines
+    """
+    decoder = json.JSONDecoder()
+    coverage = {}
+    pos = 0
+    while True:
+        while pos < len(output) and output[pos].isspace():
+            pos += 1
+        if pos >= len(output):
+            break
+        try:
+            document, pos = decoder.raw_decode(output, pos)
+        except ValueError:
+            break
+        functions = []
+        for source in document.get('files', []):
+            # lines of old gcov carry no function name, use the line ranges
+            ranges = {fn['name']: (fn['start_line'], fn['end_line'])
+                      for fn in source.get('functions', [])}
+            counts = {name: [0, 0] for name in ranges}
+            for line in source.get('lines', []):
+                names = [line['function_name']] if 'function_name' in line else \
+                    [name for name, (first, last) in ranges.items()
+                     if first <= line['line_number'] <= last]
+                for name in names:
+                    if name in counts:
+                        counts[name][1] += 1
+                        counts[name][0] += line['count'] > 0
+            functions.extend((name, gcov_percent(executed, total))
+                             for name, (executed, total) in counts.items() if total)
+        coverage[document.get('data_file')] = functions
+    return coverage
+
+
+def gcov_parse_text(output):
+    """
+    Parse the function summaries printed by gcov -f
+
+    :return: list of (function, line coverage) of the functions with
+             executable lines
+    """
+    functions = []
+    name = None
+    for line in output.splitlines():
+        if line.startswith("Function '"):
+            name = line.split(" ", 1)[-1].strip("'")
+        elif line.startswith("Lines executed:") and name:
+            functions.append((name, float(line.split(":")[-1].split("%")[0])))
+            name = None
+        elif line.startswith("File '"):
+            name = None
+    return functions
+
+
+def gcov_run(sources, object_dir, basedir_name):
+    """
+    Run gcov on a batch of source files and parse its output
+
+    :param sources: Source files, as listed in c_files.txt
+    :param object_dir: Dir holding the .gcno and .gcda files
+    :param basedir_name: Kernel source dir to run gcov from
+    :return: dict of source file and list of (function, line coverage),
+             None if this gcov has no JSON output
+    """
+    result = subprocess.run(["gcov", "-n", "--json-format", "--stdout", "-o", object_dir] +
+                            sources, cwd=basedir_name, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    coverage = gcov_parse_json(result.stdout)
+    if not coverage and result.returncode:
+        logger.debug("gcov JSON output failed: %s", result.stderr.strip())
+        return None
+    return coverage
+
+
 def gcov_code_coverage(basedir_name, test_name, driver_name=None):
     """
     Capture the gcov code coverage
+
+    gcov is run on batches of source files and its JSON output is parsed
+    here, the coverage of all the covered functions is then appended to
+    final_files.txt in a single write.
+
+    :param basedir_name: Kernel source dir, as built with gcov
+    :param test_name: Test name recorded with the coverage
+    :param driver_name: Optional driver name recorded with the coverage
     """
     if not basedir_name.endswith("/"):
         basedir_name = basedir_name + "/"
-    linux_src_gcov = f"/sys/kernel/debug/gcov{basedir_name}"
-
-    # copying all the c files into c_files.txt
-    os.chdir(basedir_name)
-    if os.path.exists("c_files.txt"):
-        os.remove("c_files.txt")
-    cmd = f"find {linux_src_gcov} -maxdepth 6 -name '*.gcno' > c_files.txt"
-    runcmd(cmd, ignore_status=False)
-    cmd = "sed -i 's/gcno/c/g' c_files.txt"
-    runcmd(cmd, ignore_status=False)
-    if os.path.exists("object_directory"):
-        shutil.rmtree("object_directory")
-    time.sleep(3)
-    os.mkdir("object_directory")
-    os.chdir(linux_src_gcov)
-    gcno_cmd = "find -maxdepth 15 -name '*.gcno' -exec cp {} %sobject_directory \\;" % basedir_name
-    gcda_cmd = "find -maxdepth 15 -name '*.gcda' -exec cp {} %sobject_directory \\;" % basedir_name
-    runcmd(gcno_cmd, ignore_status=False)
-    runcmd(gcda_cmd, ignore_status=False)
-    os.chdir(basedir_name)
-    with open('c_files.txt', 'r+') as f:
-        for line in f.readlines():
-            line = line.strip()
-            cmd = f"gcov -n -f {line} -o {basedir_name}object_directory > coverage.txt"
-            runcmd(cmd, ignore_status=False)
-            runcmd("sed -n -i '/Function/{N;p}' coverage.txt", ignore_status=True)
-            covrg_percentage = 0
-            with open('coverage.txt', 'r+') as fs1:
-                for line1, line2 in itertools.zip_longest(*[fs1]*2):
-                    if not line2.startswith("Line"):
-                        continue
-                    out = line2.split(":")[-1]
-                    covrg_percentage = float(out.split("%")[0])
-                    if covrg_percentage > 0:
-                        line1 = line1.split(" ")[-1]
-                        line1 = line1.replace("'", "")
-                        line = line.split("gcov")[-1]
-                        if driver_name:
-                            final_line = line + ":" + line1.strip() + "::" + test_name + "::" + str(covrg_percentage) + "::" + driver_name
-                        else:
-                            final_line = line + ":" + line1.strip() + "::" + test_name + "::" + str(covrg_percentage)
-                        runcmd(f"echo '{final_line}' >> final_files.txt", ignore_status=False)
+    linux_src_gcov = f"{GCOV_DEBUGFS}{basedir_name}"
+    object_dir = os.path.join(basedir_name, "object_directory")
+
+    # all the c files into c_files.txt, the .gcno and .gcda files flat in
+    # object_directory where gcov -o looks for them
+    if os.path.exists(object_dir):
+        shutil.rmtree(object_dir)
+    os.mkdir(object_dir)
+    c_files = []
+    for dirpath, dirnames, filenames in os.walk(linux_src_gcov):
+        relpath = os.path.relpath(dirpath, linux_src_gcov)
+        depth = 1 if relpath == os.curdir else relpath.count(os.sep) + 2
+        if depth >= 15:
+            dirnames[:] = []
+        for filename in filenames:
+            if not filename.endswith(('.gcno', '.gcda')):
+                continue
+            path = os.path.join(dirpath, filename)
+            if filename.endswith('.gcno') and depth <= 6:
+                c_files.append(path[:-len('gcno')] + 'c')
+            # gcov debugfs files do not support sendfile, copy them plainly
+            try:
+                with open(path, 'rb') as src_fp, \
+                        open(os.path.join(object_dir, filename), 'wb') as dst_fp:
+                    shutil.copyfileobj(src_fp, dst_fp)
+            except OSError as error:
+                logger.debug("Unable to copy %s: %s", path, error)
+    with open(os.path.join(basedir_name, "c_files.txt"), 'w') as c_fp:
+        c_fp.write("".join(path + "\n" for path in c_files))
+
+    batches = [c_files[_:_ + GCOV_BATCH] for _ in range(0, len(c_files), GCOV_BATCH)]
+    coverage = {}
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        for result in pool.map(lambda batch: gcov_run(batch, object_dir, basedir_name),
+                               batches):
+            if result is None:
+                coverage = None
+                break
+            coverage.update(result)
+    if coverage is None:
+        # gcov without JSON output, run it file by file
+        logger.info("gcov has no JSON output, running it per source file")
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            outputs = pool.map(lambda path: runcmd(f"gcov -n -f {path} -o {object_dir}",
+                                                   ignore_status=True)[1], c_files)
+            coverage = {path: gcov_parse_text(output)
+                        for path, output in zip(c_files, outputs)}
+    else:
+        # files missing from a batch output, ex: gcov died midway
+        for path in c_files:
+            if path not in coverage:
+                coverage.update(gcov_run([path], object_dir, basedir_name) or {})
+
+    lines = []
+    for path in c_files:
+        source = path[len(GCOV_DEBUGFS):]
+        for function, percentage in coverage.get(path, []):
+            if percentage <= 0:
+                continue
+            final_line = f"{source}:{function}::{test_name}::{percentage}"
+            if driver_name:
+                final_line += f"::{driver_name}"
+            lines.append(final_line + "\n")
+    with open(os.path.join(basedir_name, "final_files.txt"), 'a') as final_fp:
+        final_fp.write("".join(lines))
+    logger.info("Gcov coverage of %s functions in %s files captured",
+                len(lines), len(c_files))
@@ -0,0 +1,192 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# See LICENSE for more details.
+#
+# Copyright: 2026 IBM
+
+"""
+Content addressed store for ISO and guest images.
+
+Every payload is kept once under ``<store>/objects/<sha256>`` and linked
+into the avocado-vt data dir, so bootstraps do not copy multi-GB files
+again and again.
+
+Example:
+    from lib.imagestore import ImageStore
+    store = ImageStore('/path/to/cache/images')
+    sha = store.add('isos/Fedora-Server-DVD-ppc64le-29.iso')
+    store.link(sha, 'data/avocado-vt/isos/linux/Fedora-Server-DVD-ppc64le-29.iso')
+    store.save()
+"""
+
+import os
+import shlex
+import threading
+
+from .helper import runcmd, load_json, save_json, file_digest
+from .logger import logger_init
+
+LOG_PATH = os.path.dirname(os.path.abspath(os.path.join(__file__, os.pardir)))
+
+logger = logger_init(filepath=LOG_PATH).getlogger()
+
+
+class ImageStore:
+    """
+    Checksum indexed local store of images
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Directory of the store, created if needed
+        """
+        self.path = path
+        self.objects = os.path.join(path, 'objects')
+        os.makedirs(self.objects, exist_ok=True)
+        self.index_file = os.path.join(path, 'index.json')
+        index = load_json(self.index_file, {})
+        # file path -> [size, mtime, sha256], to avoid hashing unchanged files
+        self.files = index.get('files', {})
+        # image set name -> {file name: sha256}
+        self.sets = index.get('sets', {})
+        self.lock = threading.Lock()
+
+    def object_path(self, sha):
+        return os.path.join(self.objects, sha)
+
+    def checksum(self, path):
+        """
+        Return the sha256 of the given file, hashing it only if it changed
+        since it was last seen
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            known = self.files.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime:
+            return known[2]
+        logger.debug("Computing checksum of %s", path)
+        sha = file_digest(path)
+        with self.lock:
+            self.files[path] = [stat.st_size, stat.st_mtime, sha]
+        return sha
+
+    @staticmethod
+    def _place(src, dest, hardlink=True):
+        """
+        Make dest a hardlink of src, or a reflink copy where hardlinks are
+        not possible or not wanted. cp falls back to a full copy on file
+        systems without reflink support.
+        """
+        tmp_dest = "%s.%s.tmp" % (dest, threading.get_ident())
+        if hardlink:
+            try:
+                os.link(src, tmp_dest)
+                os.replace(tmp_dest, dest)
+                return
+            except OSError:
+                pass
+        runcmd("cp --reflink=auto %s %s" % (shlex.quote(src), shlex.quote(tmp_dest)),
+               err_str="Failed to copy %s to %s:" % (src, dest))
+        os.replace(tmp_dest, dest)
+
+    def add(self, path, hardlink=True):
+        """
+        Add the given file to the store
+
+        :param path: Path of the file
+        :param hardlink: Share the inode with the file, only for files that
+                         are never modified in place, like ISOs
+        :return: sha256 of the file
+        """
+        sha = self.checksum(path)
+        if not os.path.isfile(self.object_path(sha)):
+            logger.debug("Adding %s to image store", path)
+            self._place(path, self.object_path(sha), hardlink)
+        return sha
+
+    def link(self, sha, dest, hardlink=True):
+        """
+        Put the stored file with the given checksum at dest
+
+        :param sha: sha256 of a stored file
+        :param dest: Destination path
+        :param hardlink: Share the inode with the store, only for files
+                         that are never modified in place, like ISOs
+        """
+        src = self.object_path(sha)
+        if os.path.exists(dest):
+            if os.path.samefile(src, dest):
+                return
+            # an earlier copy, untouched since it was placed
+            stat = os.stat(dest)
+            with self.lock:
+                known = self.files.get(os.path.abspath(dest))
+            if known == [stat.st_size, stat.st_mtime, sha]:
+                return
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        self._place(src, dest, hardlink)
+        if not hardlink:
+            # remember the fresh copy, so that it is not hashed next time
+            self.checksum(dest)
+
+    def add_set(self, name, paths, hardlink=True):
+        """
+        Record a named set of files, ex: the files of a guest image
+        """
+        entries = {os.path.basename(path): self.add(path, hardlink) for path in paths}
+        with self.lock:
+            self.sets[name] = entries
+
+    def get_set(self, name):
+        """
+        Return the files of the named set, None if the set is unknown or
+        some of its files are missing in the store
+        """
+        entries = self.sets.get(name)
+        if not entries:
+            return None
+        if not all(os.path.isfile(self.object_path(sha)) for sha in entries.values()):
+            return None
+        return entries
+
+    def link_set(self, name, dest_dir, hardlink=False):
+        """
+        Put the files of the named set under dest_dir
+        :return: list of paths of the linked files
+        """
+        paths = []
+        for file_name, sha in self.get_set(name).items():
+            dest = os.path.join(dest_dir, file_name)
+            self.link(sha, dest, hardlink)
+            paths.append(dest)
+        return paths
+
+    def save(self):
+        with self.lock:
+            # forget files which do not exist anymore
+            self.files = {path: entry for path, entry in self.files.items()
+                          if os.path.exists(path)}
+            save_json(self.index_file, {'files': self.files, 'sets': self.sets})
+
+
+def create_overlay(base_image, overlay):
+    """
+    Create a qcow2 copy-on-write overlay on top of the given image
+    :param base_image: Path of the qcow2 image, left unmodified
+    :param overlay: Path of the overlay to create
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(overlay)), exist_ok=True)
+    if os.path.exists(overlay):
+        os.remove(overlay)
+    cmd = "qemu-img create -f qcow2 -F qcow2 -b %s %s" % (shlex.quote(base_image),
+                                                          shlex.quote(overlay))
+    runcmd(cmd, err_str="Failed to create overlay of %s:" % base_image,
+           debug_str="Creating overlay %s" % overlay)
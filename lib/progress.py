@@ -0,0 +1,128 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# See LICENSE for more details.
+#
+# Copyright: 2026 IBM
+
+"""
+Live progress of the avocado jobs run by the wrapper.
+
+The status lines avocado prints while a job runs, ex::
+
+     (1/12) io/disk/disk_info.py:DiskInfo.test: STARTED
+     (1/12) io/disk/disk_info.py:DiskInfo.test: PASS (12.34 s)
+
+are turned into per test start and finish events, with running counts of
+the whole run and an ETA of the job, logged and optionally appended as
+JSON lines to a progress file for dashboards.
+
+Example:
+    from lib.progress import ProgressTracker
+    progress = ProgressTracker('/tmp/progress.jsonl')
+    for line in avocado_output:
+        progress.feed('host_sanity', line)
+"""
+
+import os
+import re
+import json
+import time
+import threading
+
+from .logger import logger_init
+
+LOG_PATH = os.path.dirname(os.path.abspath(os.path.join(__file__, os.pardir)))
+
+logger = logger_init(filepath=LOG_PATH).getlogger()
+
+STATUS_LINE = re.compile(r'^\s*\((\d+)/(\d+)\)\s+(.+):\s+'
+                         r'(STARTED|PASS|FAIL|ERROR|SKIP|WARN|CANCEL|INTERRUPTED)'
+                         r'(?:\s+\(([\d.]+)\s*s\))?')
+
+
+class ProgressTracker:
+    """
+    Running counts and ETA of the tests of a run, updated test by test
+    """
+
+    def __init__(self, progress_file=None):
+        """
+        :param progress_file: File to append the events to, as JSON lines
+        """
+        self.progress_file = progress_file
+        self.counts = {}
+        # suite name -> [tests finished, tests in the job, seconds spent,
+        #                tests running]
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def eta(self, suite):
+        """
+        Return the estimated seconds left for the job of the given suite,
+        None until a test of the job has finished
+        """
+        done, total, spent, _ = self.jobs.get(suite, (0, 0, 0, 0))
+        if not done:
+            return None
+        return round(spent / done * (total - done), 1)
+
+    def feed(self, suite, line):
+        """
+        Update the progress with a line of the avocado output of the suite
+        :return: event dict, None if the line is not a test status line
+        """
+        match = STATUS_LINE.match(line)
+        if not match:
+            return None
+        index, total, test, status, duration = match.groups()
+        event = {'time': time.time(), 'suite': suite, 'test': test,
+                 'index': int(index), 'total': int(total)}
+        with self.lock:
+            job = self.jobs.setdefault(suite, [0, 0, 0.0, 0])
+            job[1] = int(total)
+            if status == 'STARTED':
+                event['event'] = 'start'
+                job[3] += 1
+            else:
+                event['event'] = 'finish'
+                event['status'] = status
+                # old runners print no STARTED line
+                job[3] = max(job[3] - 1, 0)
+                self.counts[status] = self.counts.get(status, 0) + 1
+                job[0] += 1
+                if duration:
+                    event['duration'] = float(duration)
+                    job[2] += float(duration)
+            running = sum(_[3] for _ in self.jobs.values())
+            event['running'] = running
+            event['counts'] = dict(self.counts)
+            event['eta'] = self.eta(suite)
+            self.write(event)
+        if event['event'] == 'finish':
+            logger.debug("%s: %s/%s done, %s running, ETA %ss, %s", suite, job[0],
+                         job[1], running, event['eta'], event['counts'])
+        return event
+
+    def write(self, event):
+        if not self.progress_file:
+            return
+        try:
+            with open(self.progress_file, 'a') as progress_fp:
+                progress_fp.write(json.dumps(event) + "\n")
+        except OSError as error:
+            logger.debug("Unable to write progress to %s: %s", self.progress_file, error)
+            self.progress_file = None
+
+    def end_job(self, suite):
+        """
+        Forget the job of the given suite, once it has exited
+        """
+        with self.lock:
+            self.jobs.pop(suite, None)
@@ -0,0 +1,225 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# See LICENSE for more details.
+#
+# Copyright: 2026 IBM
+
+"""
+SQLite store of the results of all the runs of the wrapper.
+
+Every finished suite's results.json is ingested with the run it belongs
+to, so history queries do not need to crawl the results dirs.
+
+Example:
+    from lib.results_db import ResultsDB
+    db = ResultsDB('cache/results.db')
+    for row in db.test_history('io/disk/disk_info.py', status=('FAIL', 'ERROR')):
+        print(row)
+
+or straight from the shell::
+
+    sqlite3 cache/results.db "SELECT * FROM tests WHERE status = 'FAIL'"
+"""
+
+import os
+import re
+import time
+import socket
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL,
+    host TEXT,
+    kernel TEXT,
+    distro TEXT,
+    args TEXT,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS suites (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER REFERENCES runs(id),
+    name TEXT,
+    job_id TEXT,
+    job_dir TEXT,
+    timestamp REAL,
+    total INTEGER,
+    pass INTEGER,
+    errors INTEGER,
+    failures INTEGER,
+    skip INTEGER,
+    warn INTEGER,
+    interrupt INTEGER,
+    cancel INTEGER,
+    time REAL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER REFERENCES runs(id),
+    suite_id INTEGER REFERENCES suites(id),
+    suite TEXT,
+    name TEXT,
+    status TEXT,
+    fail_reason TEXT,
+    time REAL,
+    timestamp REAL,
+    host TEXT,
+    kernel TEXT,
+    logdir TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs(timestamp);
+CREATE INDEX IF NOT EXISTS suites_name ON suites(name);
+CREATE INDEX IF NOT EXISTS suites_run ON suites(run_id);
+CREATE INDEX IF NOT EXISTS tests_name ON tests(name);
+CREATE INDEX IF NOT EXISTS tests_status ON tests(status);
+CREATE INDEX IF NOT EXISTS tests_suite ON tests(suite);
+CREATE INDEX IF NOT EXISTS tests_host ON tests(host);
+CREATE INDEX IF NOT EXISTS tests_kernel ON tests(kernel);
+CREATE INDEX IF NOT EXISTS tests_timestamp ON tests(timestamp);
+CREATE INDEX IF NOT EXISTS tests_run ON tests(run_id);
+"""
+
+# "1-io/disk/disk_info.py:DiskInfo.test;run-b3e1" -> the name without
+# the index of the test in its job
+TEST_INDEX = re.compile(r'^\d+-')
+# results.json counters stored per suite
+SUITE_COUNTS = ('total', 'pass', 'errors', 'failures', 'skip', 'warn',
+                'interrupt', 'cancel')
+
+
+class ResultsDB:
+    """
+    Results of the runs, suites and tests, shared by the threads of a run
+    """
+
+    def __init__(self, path, test_dir=None):
+        """
+        :param path: Database file, created if needed
+        :param test_dir: Tests dir, stripped from the test names
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.test_prefix = os.path.join(test_dir, '') if test_dir else None
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+        self.host = socket.gethostname()
+        self.kernel = os.uname().release
+
+    def start_run(self, distro='', args=''):
+        """
+        Record a new run of this host
+        :return: id of the run
+        """
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (timestamp, host, kernel, distro, args) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (time.time(), self.host, self.kernel, distro, args))
+        return cursor.lastrowid
+
+    def end_run(self, run_id, summary):
+        """
+        Record the final count summary of a run
+        :param summary: Summary text, ex: JSON of the result counts
+        """
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE runs SET summary = ? WHERE id = ?",
+                              (summary, run_id))
+
+    def add_suite(self, run_id, name, job_dir, results):
+        """
+        Ingest the results.json of a finished suite
+
+        :param run_id: Id of the run from start_run()
+        :param name: Name of the suite
+        :param job_dir: Job results dir of the suite
+        :param results: Loaded results.json of the job
+        :return: id of the suite
+        """
+        timestamp = time.time()
+        counts = [int(results.get(key, 0) or 0) for key in SUITE_COUNTS]
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO suites (run_id, name, job_id, job_dir, timestamp, %s, time) "
+                "VALUES (?, ?, ?, ?, ?, %s, ?)" % (', '.join(SUITE_COUNTS),
+                                                   ', '.join('?' * len(SUITE_COUNTS))),
+                [run_id, name, results.get('job_id'), job_dir, timestamp] + counts +
+                [results.get('time')])
+            suite_id = cursor.lastrowid
+            rows = []
+            for test in results.get('tests', []):
+                test_name = test.get('name') or test.get('id') or test.get('test') or ''
+                test_name = TEST_INDEX.sub('', str(test_name))
+                if self.test_prefix and test_name.startswith(self.test_prefix):
+                    test_name = test_name[len(self.test_prefix):]
+                rows.append((run_id, suite_id, name, test_name,
+                             test.get('status'), test.get('fail_reason'),
+                             test.get('time'), test.get('start') or timestamp,
+                             self.host, self.kernel, test.get('logdir')))
+            self.conn.executemany(
+                "INSERT INTO tests (run_id, suite_id, suite, name, status, fail_reason, "
+                "time, timestamp, host, kernel, logdir) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return suite_id
+
+    def test_history(self, name, status=None, last_runs=30):
+        """
+        Return the results of the tests whose name starts with the given
+        name in the last runs, newest first
+
+        :param name: Test name or name prefix, ex: io/disk/disk_info.py
+        :param status: Optional tuple of statuses to keep, ex: ('FAIL',)
+        :param last_runs: Number of most recent runs to look at
+        """
+        query = ("SELECT tests.*, runs.timestamp AS run_timestamp FROM tests "
+                 "JOIN runs ON runs.id = tests.run_id "
+                 "WHERE tests.run_id IN (SELECT id FROM runs ORDER BY timestamp DESC LIMIT ?) "
+                 "AND tests.name >= ? AND tests.name < ?")
+        params = [last_runs, name, name + '\uffff']
+        if status:
+            query += " AND tests.status IN (%s)" % ', '.join('?' * len(status))
+            params.extend(status)
+        query += " ORDER BY tests.timestamp DESC"
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def suite_durations(self, names, last_runs=5):
+        """
+        Return the average duration of the given suites over their last
+        runs, suites which never completed are left out
+
+        :param names: Suite names
+        :param last_runs: Number of most recent runs of a suite to average
+        :return: dict of suite name and duration in seconds
+        """
+        names = list(set(names))
+        times = {}
+        with self.lock:
+            # stay below the SQLite limit of host parameters
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                rows = self.conn.execute(
+                    "SELECT name, time FROM suites WHERE time IS NOT NULL AND name IN (%s) "
+                    "ORDER BY timestamp DESC" % ', '.join('?' * len(chunk)), chunk)
+                for name, duration in rows:
+                    suite_times = times.setdefault(name, [])
+                    if len(suite_times) < last_runs:
+                        suite_times.append(duration)
+        return {name: sum(suite_times) / len(suite_times)
+                for name, suite_times in times.items()}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,184 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# See LICENSE for more details.
+#
+# Copyright: 2026 IBM
+
+"""
+In process sampler of system resource usage.
+
+A thread reads /proc/stat, /proc/meminfo, /proc/diskstats and /proc/net/dev
+at a fixed interval into a bounded ring buffer, with no process forked, and
+the samples taken while a suite ran are written as a CSV time series.
+
+Example:
+    from lib.sampler import ResourceSampler
+    sampler = ResourceSampler(interval=1)
+    sampler.start()
+    start = time.time()
+    ...
+    sampler.write_csv('results/job-.../resources.csv', since=start)
+    sampler.stop()
+"""
+
+import os
+import csv
+import time
+import threading
+from collections import deque
+
+from .logger import logger_init
+
+LOG_PATH = os.path.dirname(os.path.abspath(os.path.join(__file__, os.pardir)))
+
+logger = logger_init(filepath=LOG_PATH).getlogger()
+
+# Columns of a sample, counters are turned into rates per second
+FIELDS = ('time', 'cpu_user', 'cpu_system', 'cpu_iowait', 'cpu_idle',
+          'mem_used_kb', 'mem_available_kb', 'disk_read_kbps', 'disk_write_kbps',
+          'disk_io_ms', 'net_rx_kbps', 'net_tx_kbps')
+SECTOR_KB = 0.5
+# block device name -> whether it is a partition
+partitions = {}
+
+
+def read_cpu():
+    """
+    Return the aggregate cpu jiffies: user, system, iowait, idle, total
+    """
+    with open('/proc/stat') as stat_fp:
+        values = [int(_) for _ in stat_fp.readline().split()[1:]]
+    user, nice, system, idle, iowait = values[:5]
+    return (user + nice, system + sum(values[5:7]), iowait, idle, sum(values[:8]))
+
+
+def read_meminfo():
+    """
+    Return used and available memory in kB
+    """
+    meminfo = {}
+    with open('/proc/meminfo') as mem_fp:
+        for line in mem_fp:
+            key, value = line.split(':', 1)
+            if key in ('MemTotal', 'MemAvailable'):
+                meminfo[key] = int(value.split()[0])
+    available = meminfo.get('MemAvailable', 0)
+    return (meminfo.get('MemTotal', 0) - available, available)
+
+
+def read_diskstats():
+    """
+    Return sectors read, sectors written and ms spent doing IO, summed over
+    the whole disks, partitions and virtual devices left out
+    """
+    read = written = io_ms = 0
+    with open('/proc/diskstats') as disk_fp:
+        for line in disk_fp:
+            fields = line.split()
+            name = fields[2]
+            if name not in partitions:
+                partitions[name] = os.path.exists('/sys/class/block/%s/partition' % name)
+            if partitions[name] or name.startswith(('loop', 'ram', 'dm-', 'zram')):
+                continue
+            read += int(fields[5])
+            written += int(fields[9])
+            io_ms += int(fields[12])
+    return (read, written, io_ms)
+
+
+def read_netdev():
+    """
+    Return bytes received and sent over all interfaces but loopback
+    """
+    rx_bytes = tx_bytes = 0
+    with open('/proc/net/dev') as net_fp:
+        for line in net_fp.readlines()[2:]:
+            name, values = line.split(':', 1)
+            if name.strip() == 'lo':
+                continue
+            values = values.split()
+            rx_bytes += int(values[0])
+            tx_bytes += int(values[8])
+    return (rx_bytes, tx_bytes)
+
+
+class ResourceSampler(threading.Thread):
+    """
+    Thread sampling system resources into a ring buffer
+    """
+
+    def __init__(self, interval=1.0, size=21600):
+        """
+        :param interval: Seconds between samples
+        :param size: Number of samples kept, older ones are dropped
+        """
+        super().__init__(name='resource-sampler', daemon=True)
+        self.interval = interval
+        self.samples = deque(maxlen=size)
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def read():
+        return (time.time(), read_cpu(), read_meminfo(), read_diskstats(), read_netdev())
+
+    def run(self):
+        try:
+            last = self.read()
+        except (OSError, ValueError, IndexError) as error:
+            logger.warning("Resource sampling disabled: %s", error)
+            return
+        while not self.stopped.wait(self.interval):
+            try:
+                current = self.read()
+            except (OSError, ValueError, IndexError) as error:
+                logger.debug("Resource sample failed: %s", error)
+                continue
+            sample = self.rates(last, current)
+            with self.lock:
+                self.samples.append(sample)
+            last = current
+
+    @staticmethod
+    def rates(last, current):
+        """
+        Turn two raw readings into a sample of FIELDS
+        """
+        seconds = max(current[0] - last[0], 1e-6)
+        cpu = [now - before for now, before in zip(current[1], last[1])]
+        total = max(cpu[4], 1)
+        # counters of a device gone meanwhile drop out of the sums
+        disk = [max(now - before, 0) for now, before in zip(current[3], last[3])]
+        net = [max(now - before, 0) for now, before in zip(current[4], last[4])]
+        return (round(current[0], 3),
+                round(100.0 * cpu[0] / total, 1), round(100.0 * cpu[1] / total, 1),
+                round(100.0 * cpu[2] / total, 1), round(100.0 * cpu[3] / total, 1),
+                current[2][0], current[2][1],
+                round(disk[0] * SECTOR_KB / seconds, 1),
+                round(disk[1] * SECTOR_KB / seconds, 1),
+                round(disk[2] / seconds, 1),
+                round(net[0] / 1024.0 / seconds, 1), round(net[1] / 1024.0 / seconds, 1))
+
+    def write_csv(self, path, since=0, until=None):
+        """
+        Write the samples taken between since and until to a CSV file
+        :return: number of samples written
+        """
+        until = until or time.time()
+        with self.lock:
+            samples = [_ for _ in self.samples if since <= _[0] <= until]
+        with open(path, 'w', newline='') as csv_fp:
+            writer = csv.writer(csv_fp)
+            writer.writerow(FIELDS)
+            writer.writerows(samples)
+        return len(samples)
+
+    def stop(self):
+        self.stopped.set()
@@ -73,6 +73,13 @@ def create_config_inputs(orig_cfg, new_cfg, inputfile, interface, config_type):
 
     # Copy configuration file
     shutil.copy("config/tests/host/%s.cfg" % orig_cfg, "config/tests/host/%s.cfg" % new_cfg)
+    if interface.get('pci_root'):
+        # tag the suite with its adapter, so that avocado-setup.py does not
+        # run suites of the same adapter at the same time
+        with open("config/tests/host/%s.cfg" % new_cfg, 'r+') as cfg_file:
+            cfg_content = cfg_file.read()
+            cfg_file.seek(0)
+            cfg_file.write("# pci_root: %s\n%s" % (interface['pci_root'], cfg_content))
 
     test_suites.append("host_%s" % new_cfg)
 